@@ -0,0 +1,223 @@
+"""
+Times the expensive helpers of Common and DjangoCommon, and the
+FactorySquirrel, on inputs from small to very large, and writes the
+results to JSON.
+
+    python benchmarks/assertions.py [--max-bytes 10000000] [--max-rows 100000]
+        [--output temp/benchmarks/assertions.json]
+        [--compare old.json [--tolerance 0.25]]
+
+Run it from the root of the checkout with Django, lxml and BeautifulSoup
+installed. The xml assertions and assert_contains get documents of 1KB to
+10MB, render and the squirrel 10 to 100,000 rows, in an in-memory SQLite
+database. Cases whose first call takes over a second are only timed once.
+--compare exits with status 1 if the median of any case grew by more than
+the tolerance since the saved results.
+"""
+
+import os
+import sys
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.abspath('src'))
+
+from django.conf import settings
+settings.configure(DATABASE_ENGINE='sqlite3', DATABASE_NAME=':memory:',
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:'}},
+    INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth'])
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from django.core.management.color import no_style
+from django.db import connection, models
+
+from test_extensions.django_common import DjangoCommon
+from test_extensions.factory_squirrel import FactorySquirrel
+from test_extensions.timing import measure, summarize
+
+BYTES = (1000, 10000, 100000, 1000000, 10000000)
+ROWS = (10, 100, 1000, 10000, 100000)
+
+# cases whose first call takes longer are only timed once
+SLOW = 1.0
+
+class Customer(models.Model):
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        app_label = 'benchmarks'
+
+class Order(models.Model):
+    customer = models.ForeignKey(Customer)
+    number = models.IntegerField()
+
+    class Meta:
+        app_label = 'benchmarks'
+
+class Helpers(DjangoCommon):
+    "Lends the helpers out without running as a test"
+    def runTest(self):
+        pass
+
+def xml_document(size):
+    "Returns a catalogue of items about size bytes long, its last item with id last"
+    item = '<item id="%d"><name>item %d</name><price>%d.99</price></item>\n'
+    items = []
+    length = 0
+    number = 0
+    while length < size:
+        items.append(item % (number, number, number % 100))
+        length += len(items[-1])
+        number += 1
+    items[-1] = items[-1].replace('id="%d"' % (number - 1), 'id="last"')
+    return '<catalogue>\n%s</catalogue>' % ''.join(items)
+
+def html_document(size):
+    "Returns a page with a table about size bytes long"
+    row = '<tr><td class="number">%d</td><td>row %d</td></tr>\n'
+    rows = []
+    length = 0
+    number = 0
+    while length < size:
+        rows.append(row % (number, number))
+        length += len(rows[-1])
+        number += 1
+    return '<html><head><title>rows</title></head><body><table id="rows">\n%s</table></body></html>' % ''.join(rows)
+
+def create_tables():
+    cursor = connection.cursor()
+    for model in (Customer, Order):
+        statements, pending = connection.creation.sql_create_model(model,
+            no_style(), set())
+        for statement in statements:
+            cursor.execute(statement)
+
+def fill(rows, orders_per_customer=9):
+    "Replaces the graph with rows customers and orders, nine orders to a customer"
+    Order.objects.all().delete()
+    Customer.objects.all().delete()
+    customers = []
+    for number in range(0, rows, orders_per_customer + 1):
+        customer = Customer.objects.create(name='customer %d' % number)
+        customers.append(customer)
+        for order in range(min(orders_per_customer, rows - number - 1)):
+            Order.objects.create(customer=customer, number=order)
+    return customers
+
+def dig_up(granary):
+    "Runs a buried granary, as a fixture file would be"
+    class Suite(object):
+        pass
+    namespace = {'suite': Suite()}
+    exec granary in namespace
+
+def time_case(callable, rounds, warmup):
+    "Times callable, once if its first call is slow"
+    first = measure(callable, 1, 0)
+    if first[0] > SLOW:
+        return summarize(first)
+    return summarize(first + measure(callable, rounds - 1, max(warmup - 1, 0)))
+
+def cases(helpers, max_bytes, max_rows):
+    "Yields the name, size and callable of each case"
+    for size in [size for size in BYTES if size <= max_bytes]:
+        xml = xml_document(size)
+        html = html_document(size)
+        yield 'assert_xml', size, lambda: helpers.assert_xml(xml,
+            '//item[@id="last"]/name')
+        yield 'assert_xml html', size, lambda: helpers.assert_xml(html,
+            '//table[@id="rows"]/tr/td[@class="number"]')
+        yield 'assert_xml_tree', size, lambda: helpers.assert_xml_tree(xml,
+            lambda XML: XML.catalogue(XML.item(XML.name(), id='last')))
+        yield 'deny_xml', size, lambda: helpers.deny_xml(xml,
+            '//item[@id="missing"]')
+        yield 'assert_contains', size, lambda: helpers.assert_contains(
+            'id="last"', xml)
+
+    template = '<ul>{% for row in rows %}<li>{{ row }}</li>{% endfor %}</ul>'
+    for rows in [rows for rows in ROWS if rows <= max_rows]:
+        numbers = range(rows)
+        expected = '<ul>%s</ul>' % ''.join(['<li>%d</li>' % number
+            for number in numbers])
+        yield 'render', rows, lambda: helpers.render(template, rows=numbers)
+        yield 'assert_render', rows, lambda: helpers.assert_render(expected,
+            template, rows=numbers)
+
+        customers = fill(rows)
+        # dig_up runs what the last bury returned
+        buried = []
+        def bury():
+            buried[:] = [FactorySquirrel().bury(customers)]
+        yield 'bury', rows, bury
+        yield 'dig_up', rows, lambda: dig_up(buried[0])
+
+def compare(results, saved, tolerance):
+    "Returns a description of each case whose median grew beyond the tolerance"
+    regressions = []
+    for key, statistics in sorted(results.items()):
+        old = saved.get(key)
+        if old and statistics['median'] > old['median'] * (1 + tolerance):
+            regressions.append('%s went from %.6fs to %.6fs' % (key,
+                old['median'], statistics['median']))
+    return regressions
+
+def main(args):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--max-bytes', type='int', default=BYTES[-1],
+        help='the largest document')
+    parser.add_option('--max-rows', type='int', default=ROWS[-1],
+        help='the most rows')
+    parser.add_option('--rounds', type='int', default=5,
+        help='timed calls of each case')
+    parser.add_option('--warmup', type='int', default=1,
+        help='untimed calls before them')
+    parser.add_option('--output', default=os.path.join('temp', 'benchmarks',
+        'assertions.json'), help='the JSON file for the results')
+    parser.add_option('--compare', default=None,
+        help='fail if the results are worse than the ones in this JSON file')
+    parser.add_option('--tolerance', type='float', default=0.25,
+        help='how much worse than the compared results is tolerated')
+    options, args = parser.parse_args(args)
+
+    create_tables()
+    helpers = Helpers()
+    results = {}
+    print "%-18s %9s %6s %12s %12s %12s" % ('case', 'size', 'rounds',
+        'min (ms)', 'median (ms)', 'p95 (ms)')
+    for name, size, callable in cases(helpers, options.max_bytes,
+            options.max_rows):
+        statistics = time_case(callable, options.rounds, options.warmup)
+        statistics['case'] = name
+        statistics['size'] = size
+        results['%s/%d' % (name, size)] = statistics
+        print "%-18s %9d %6d %12.3f %12.3f %12.3f" % (name, size,
+            statistics['rounds'], statistics['min'] * 1000,
+            statistics['median'] * 1000, statistics['p95'] * 1000)
+
+    directory = os.path.dirname(options.output)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    output = open(options.output, 'w')
+    json.dump(results, output, indent=1, sort_keys=True)
+    output.close()
+    print "Results written to %s" % options.output
+
+    if options.compare:
+        saved = open(options.compare)
+        try:
+            regressions = compare(results, json.load(saved), options.tolerance)
+        finally:
+            saved.close()
+        if regressions:
+            print "Worse than %s:" % options.compare
+            for regression in regressions:
+                print "    " + regression
+            sys.exit(1)
+        print "No worse than %s" % options.compare
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
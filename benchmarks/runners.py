@@ -0,0 +1,222 @@
+"""
+Measures the time and memory each test runner adds per test, on synthetic
+suites of trivial tests, a tenth of which write a couple of kilobytes to
+stdout and stderr.
+
+    python benchmarks/runners.py [--sizes 1000,10000,50000] [--repeats 3]
+        [--save results.json] [--compare results.json [--tolerance 0.25]]
+
+Run it from the root of the checkout with Django installed, and xmlunit and
+coverage for their runners. Every measurement runs in a fresh interpreter,
+in a scratch directory, so the peak RSS is the runner's own. --save writes
+the results as JSON; --compare fails, with exit status 1, if the per test
+time or the memory of any runner grew by more than the tolerance since the
+saved results, for guarding changes to the runners.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+SETUP = """
+import os
+import sys
+import time
+import unittest
+sys.path.insert(0, %(src)r)
+from django.conf import settings
+settings.configure(DATABASE_ENGINE='sqlite3', DATABASE_NAME=':memory:',
+    INSTALLED_APPS=[])
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from test_extensions.testrunners.phases import peak_rss
+
+OUTPUT = 'x' * 2048
+
+def trivial(self):
+    pass
+
+def chatty(self):
+    sys.stdout.write(OUTPUT)
+    sys.stderr.write(OUTPUT)
+
+def make_suite(size, per_class=100, per_app=1000):
+    "Nests the tests in app and class suites, the way Django builds them"
+    suite = unittest.TestSuite()
+    for first in range(0, size, per_class):
+        if not first %% per_app:
+            app = unittest.TestSuite()
+            suite.addTest(app)
+        methods = {}
+        for number in range(first, min(first + per_class, size)):
+            methods['test_%%05d' %% number] = number %% 10 and trivial or chatty
+        case = type('Synthetic%%05d' %% first, (unittest.TestCase,), methods)
+        app.addTest(unittest.makeSuite(case))
+    return suite
+
+suite = make_suite(%(size)d)
+devnull = open(os.devnull, 'w')
+before = peak_rss()
+start = time.time()
+"""
+
+REPORT = """
+elapsed = time.time() - start
+report = open(%(report)r, 'w')
+json.dump({'seconds': elapsed, 'peak_rss_kb': peak_rss(),
+    'before_kb': before}, report)
+report.close()
+"""
+
+RUNNERS = (
+    ('plain', """
+unittest.TextTestRunner(stream=devnull, verbosity=0).run(suite)
+"""),
+    ('xml', """
+from test_extensions.testrunners.xmloutput import XMLTestRunner
+XMLTestRunner(verbosity=0).run(suite)
+"""),
+    ('nodb', """
+from test_extensions.testrunners.nodatabase import run_tests
+sys.stderr = devnull
+run_tests([], verbosity=0, extra_tests=[suite])
+"""),
+    ('coverage', """
+from test_extensions.testrunners.codecoverage import run_tests
+sys.stderr = devnull
+run_tests([], verbosity=0, extra_tests=[suite], nodatabase=True)
+"""),
+)
+
+def measure(code, size, src):
+    """
+    Runs a suite of size tests with one runner in a fresh interpreter,
+    returning its figures, or None and the last line of the error
+    """
+    directory = tempfile.mkdtemp(prefix='runners')
+    report = os.path.join(directory, 'report.json')
+    try:
+        script = (SETUP + code + REPORT) % {'src': src, 'size': size,
+            'report': report}
+        process = subprocess.Popen([sys.executable, '-c', script],
+            cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = process.communicate()
+        if process.returncode or not os.path.exists(report):
+            lines = errors.strip().splitlines() or ['exit status %d' % process.returncode]
+            return None, lines[-1]
+        report = open(report)
+        try:
+            return json.load(report), None
+        finally:
+            report.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def best_of(code, size, src, repeats):
+    "Returns the fastest of repeats measurements, or None and the error"
+    best = None
+    for i in range(repeats):
+        figures, error = measure(code, size, src)
+        if figures is None:
+            return None, error
+        if best is None or figures['seconds'] < best['seconds']:
+            best = figures
+    best['size'] = size
+    best['us_per_test'] = best['seconds'] * 1000000 / size
+    if best['peak_rss_kb'] is not None and best['before_kb'] is not None:
+        best['kb_per_test'] = float(best['peak_rss_kb'] - best['before_kb']) / size
+    else:
+        best['kb_per_test'] = None
+    return best, None
+
+def compare(results, saved, tolerance):
+    "Returns a description of each figure which grew beyond the tolerance"
+    regressions = []
+    for key, figures in results.items():
+        old = saved.get(key)
+        if not old:
+            continue
+        for figure in ('us_per_test', 'peak_rss_kb'):
+            if old.get(figure) and figures.get(figure) is not None and \
+                    figures[figure] > old[figure] * (1 + tolerance):
+                regressions.append('%s %s went from %.1f to %.1f' % (key,
+                    figure, old[figure], figures[figure]))
+    return regressions
+
+def main(args):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--sizes', default='1000,10000,50000',
+        help='comma separated suite sizes')
+    parser.add_option('--repeats', type='int', default=3,
+        help='measurements of each runner and size, the fastest is kept')
+    parser.add_option('--runners', default=None,
+        help='comma separated runners to measure, from %s' % ', '.join(
+            [name for name, code in RUNNERS]))
+    parser.add_option('--save', default=None,
+        help='write the results to this JSON file')
+    parser.add_option('--compare', default=None,
+        help='fail if the results are worse than the ones in this JSON file')
+    parser.add_option('--tolerance', type='float', default=0.25,
+        help='how much worse than the compared results is tolerated')
+    options, args = parser.parse_args(args)
+
+    if not os.path.isdir(os.path.join('src', 'test_extensions')):
+        sys.exit("Run this from the root of the checkout")
+    src = os.path.abspath('src')
+    sizes = [int(size) for size in options.sizes.split(',')]
+    runners = RUNNERS
+    if options.runners:
+        names = options.runners.split(',')
+        runners = [(name, code) for name, code in RUNNERS if name in names]
+
+    results = {}
+    print "%-10s %7s %10s %10s %12s %10s" % ('runner', 'tests', 'seconds',
+        'us/test', 'peak RSS MB', 'KB/test')
+    for size in sizes:
+        for name, code in runners:
+            figures, error = best_of(code, size, src, options.repeats)
+            if figures is None:
+                print "%-10s %7d %10s  %s" % (name, size, 'failed', error)
+                continue
+            results['%s/%d' % (name, size)] = figures
+            if figures['peak_rss_kb'] is None:
+                rss, per_test = '-', '-'
+            else:
+                rss = '%.1f' % (figures['peak_rss_kb'] / 1024.0)
+                per_test = '%.2f' % figures['kb_per_test']
+            print "%-10s %7d %10.3f %10.1f %12s %10s" % (name, size,
+                figures['seconds'], figures['us_per_test'], rss, per_test)
+
+    if options.save:
+        output = open(options.save, 'w')
+        json.dump(results, output, indent=1, sort_keys=True)
+        output.close()
+        print "Results written to %s" % options.save
+
+    if options.compare:
+        saved = open(options.compare)
+        try:
+            regressions = compare(results, json.load(saved), options.tolerance)
+        finally:
+            saved.close()
+        if regressions:
+            print "Worse than %s:" % options.compare
+            for regression in regressions:
+                print "    " + regression
+            sys.exit(1)
+        print "No worse than %s" % options.compare
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
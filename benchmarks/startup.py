@@ -0,0 +1,84 @@
+"""
+Measures how long it takes to get hold of a test runner, from a fresh
+interpreter, and which coverage tools get imported on the way.
+
+    python benchmarks/startup.py [repeats]
+
+Run it from the root of the checkout with Django installed. The "eager"
+rows import coverage or figleaf alongside the runner, the way the runner
+modules used to on import.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+SETUP = """
+import sys
+sys.path.insert(0, 'src')
+from django.conf import settings
+settings.configure(DATABASE_ENGINE='sqlite3', DATABASE_NAME=':memory:',
+    INSTALLED_APPS=[])
+"""
+
+REPORT = """
+print ' '.join([name for name in ('coverage', 'figleaf') if name in sys.modules])
+"""
+
+CASES = (
+    ('django only', ''),
+    ('--nodb', """
+from test_extensions.testrunners import registry
+registry.get_runner('nodb')
+"""),
+    ('--nodb, eager', """
+import coverage
+from test_extensions.testrunners import registry
+registry.get_runner('nodb')
+"""),
+    ('--coverage', """
+from test_extensions.testrunners import registry
+registry.get_runner('coverage')
+"""),
+    ('--figleaf', """
+from test_extensions.testrunners import registry
+registry.get_runner('figleaf')
+"""),
+)
+
+def time_case(code, repeats):
+    "Returns the fastest of repeats runs of code, and what it imported"
+    best = None
+    imported = None
+    for i in range(repeats):
+        start = time.time()
+        process = subprocess.Popen([sys.executable, '-c', SETUP + code + REPORT],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = process.communicate()
+        elapsed = time.time() - start
+        if process.returncode:
+            return None, errors.strip().splitlines()[-1]
+        if best is None or elapsed < best:
+            best = elapsed
+        imported = output.strip() or '-'
+    return best, imported
+
+def main(args):
+    repeats = args and int(args[0]) or 10
+    if not os.path.isdir(os.path.join('src', 'test_extensions')):
+        sys.exit("Run this from the root of the checkout")
+    print "%-16s %10s %10s  %s" % ('runner', 'best (ms)', 'added', 'imported')
+    baseline = None
+    for name, code in CASES:
+        best, imported = time_case(code, repeats)
+        if best is None:
+            print "%-16s %10s %10s  %s" % (name, 'failed', '', imported)
+            continue
+        if baseline is None:
+            baseline = best
+        print "%-16s %10.1f %10.1f  %s" % (name, best * 1000,
+            (best - baseline) * 1000, imported)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,34 +1,26 @@
-import os
 import sys
 import traceback
 
 from django.utils import autoreload
 
-_mtimes = autoreload._mtimes
-_win = autoreload._win
+from test_extensions.watcher import get_watcher, _source_file
+
 _code_changed = autoreload.code_changed
 _error_files = []
+_watcher = None
 def my_code_changed():
-    global _mtimes, _win
-    for filename in filter(lambda v: v, map(lambda m: getattr(m, "__file__", None), sys.modules.values())) + _error_files:
-        if filename.endswith(".pyc") or filename.endswith(".pyo"):
-            filename = filename[:-1]
-        if not os.path.exists(filename):
-            continue # File might be in an egg, so it can't be reloaded.
-        stat = os.stat(filename)
-        mtime = stat.st_mtime
-        if _win:
-            mtime -= stat.st_ctime
-        if filename not in _mtimes:
-            _mtimes[filename] = mtime
-            continue
-        if mtime != _mtimes[filename]:
-            _mtimes = {}
-            try:
-                del _error_files[_error_files.index(filename)]
-            except ValueError: pass
-            return True
-    return False
+    """
+    Waits up to a second for a project module, or a file which failed to
+    import, to change.
+    """
+    global _watcher
+    if _watcher is None:
+        _watcher = get_watcher(extra_files=_error_files)
+    changed = _watcher.wait(timeout=1)
+    for filename in _error_files[:]:
+        if _source_file(filename) in changed:
+            _error_files.remove(filename)
+    return bool(changed)
 
 def check_errors(fn):
     def wrapper(*args, **kwargs):
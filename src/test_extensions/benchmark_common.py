@@ -0,0 +1,120 @@
+# Test classes inherit from the Django TestCase
+from common import Common
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from test_extensions.jsonfile import save_json
+from test_extensions.timing import measure, summarize
+
+# where the baseline timings are kept, relative to the project, for
+# committing alongside the tests
+BASELINE_FILE = 'benchmark_baseline.json'
+
+_baselines = {}
+_recording = None
+
+def load_baseline(path=BASELINE_FILE):
+    "Returns the baseline statistics in path by benchmark name, read once"
+    if path not in _baselines:
+        try:
+            baseline = open(path)
+        except IOError:
+            _baselines[path] = {}
+        else:
+            try:
+                _baselines[path] = json.load(baseline)
+            finally:
+                baseline.close()
+    return _baselines[path]
+
+def record_baselines():
+    """
+    Makes benchmarks record their statistics as the new baseline, for
+    save_baselines(), rather than compare with the old one.
+    """
+    global _recording
+    _recording = {}
+
+def save_baselines():
+    "Merges the recorded statistics into the baseline files, returning their paths"
+    global _recording
+    recorded, _recording = _recording or {}, None
+    for path, statistics in recorded.items():
+        baseline = dict(load_baseline(path))
+        baseline.update(statistics)
+        save_json(baseline, path, indent=1, sort_keys=True)
+        _baselines[path] = baseline
+    return sorted(recorded.keys())
+
+class BenchmarkCommon(Common):
+    """
+    Common with assertions about how long things take. Timings are
+    compared with the baseline file, where they're failed if they are
+    slower by more than the tolerance, and the xml runner writes each
+    benchmark's statistics into its testcase's properties.
+
+    Record a new baseline with python manage.py test --benchmark-baseline.
+    """
+
+    # the file with the baseline timings
+    benchmark_baseline = BASELINE_FILE
+
+    # how much slower than the baseline median a benchmark may run
+    benchmark_tolerance = 0.25
+
+    # the default number of timed and untimed calls
+    benchmark_rounds = 10
+    benchmark_warmup = 2
+
+    def benchmark(self, lamb, rounds=None, warmup=None, name=None, tolerance=None):
+        """
+        Time the called block over a number of rounds, after some untimed
+        warmup calls, fail if its median is slower than the baseline allows,
+        and return the rounds, min, median, p95, mean and max seconds
+        """
+        if rounds is None:
+            rounds = self.benchmark_rounds
+        if warmup is None:
+            warmup = self.benchmark_warmup
+        if tolerance is None:
+            tolerance = self.benchmark_tolerance
+
+        statistics = summarize(measure(lamb, rounds, warmup))
+        key = self._benchmark_key(name)
+        self._benchmarks.append((key, statistics))
+
+        if _recording is not None:
+            _recording.setdefault(self.benchmark_baseline, {})[key] = statistics
+            return statistics
+
+        baseline = load_baseline(self.benchmark_baseline).get(key)
+        if baseline:
+            limit = baseline['median'] * (1 + tolerance)
+            self.assert_(statistics['median'] <= limit,
+                '%s took a median %.6fs, the baseline is %.6fs and at most %.6fs is tolerated' % (
+                    key, statistics['median'], baseline['median'], limit))
+        return statistics
+
+    def assert_faster_than(self, seconds, lamb, **kw):
+        "Assert that the median time the called block takes is under the given seconds, and return the statistics"
+        statistics = self.benchmark(lamb, **kw)
+        self.assert_(statistics['median'] < seconds,
+            'the called block should take under %.6fs, took a median %.6fs (min %.6fs, p95 %.6fs)' % (
+                seconds, statistics['median'], statistics['min'],
+                statistics['p95']))
+        return statistics
+
+    def _benchmark_key(self, name):
+        if not hasattr(self, '_benchmarks'):
+            self._benchmarks = []
+        key = self.id()
+        if name:
+            return '%s.%s' % (key, name)
+        unnamed = len([other for other, statistics in self._benchmarks
+            if other == key or other.startswith(key + '#')])
+        if unnamed:
+            key = '%s#%d' % (key, unnamed + 1)
+        return key
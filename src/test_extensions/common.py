@@ -15,6 +15,9 @@ from BeautifulSoup import BeautifulSoup as Soup
 from django.contrib.auth.models import User
 from django.utils.encoding import smart_str
 
+# records queries even though the test runners turn DEBUG off
+from test_extensions.queries import capture_queries
+
 
 class Common(TestCase):
     """
@@ -106,6 +109,30 @@ class Common(TestCase):
         actual_counts = [model.objects.count() for model in models]
         self.assert_equal(expected_counts, actual_counts, "%s should have counts %s but had %s" % ([m.__name__ for m in models], expected_counts, actual_counts))
 
+    def assert_num_queries(self, expected, lamb):
+        "Assert that the called block runs exactly the expected number of queries, and return them"
+        queries = self._capture_queries(lamb)
+        self.assert_equal(expected, len(queries),
+            'the called block should run %d queries, ran %d:\n%s' % (expected,
+                len(queries), _format_queries(queries)))
+        return queries
+
+    def assert_max_queries(self, most, lamb):
+        "Assert that the called block runs no more than a given number of queries, and return them"
+        queries = self._capture_queries(lamb)
+        self.assert_(len(queries) <= most,
+            'the called block should run at most %d queries, ran %d:\n%s' % (most,
+                len(queries), _format_queries(queries)))
+        return queries
+
+    def _capture_queries(self, lamb):
+        queries = capture_queries()
+        try:
+            lamb()
+        finally:
+            queries.stop()
+        return queries
+
     def assert_is_instance(self, model, obj):
         "Assert than a given object is an instance of a model"
         self.assert_(isinstance(obj, model), "%s should be instance of %s" % (obj, model))
@@ -283,4 +310,6 @@ class Common(TestCase):
         code += ')'
         return code
 
-
+def _format_queries(queries):
+    return '\n'.join(['%d. %s' % (number + 1, smart_str(query['sql']))
+        for number, query in enumerate(queries)])
@@ -8,6 +8,8 @@ from django.contrib.auth.models import User
 
 from django.template import Template, Context
 
+from test_extensions.queries import capture_queries, repeated_queries
+
 class DjangoCommon(Common):
     """
     This class contains a number of custom assertions which
@@ -18,6 +20,13 @@ class DjangoCommon(Common):
     # a list of fixtures for loading data before each test
     fixtures = []
 
+    # Set to True to fail every self.client request whose view runs the
+    # same statement over and over with different values, the N+1 pattern
+    detect_n_plus_one = False
+
+    # how often one statement may run in a request before it counts
+    n_plus_one_threshold = 3
+
     def setUp(self):
         """
         setUp is run before each test in the class. Use it for
@@ -32,6 +41,23 @@ class DjangoCommon(Common):
         """
         pass
 
+    def _pre_setup(self):
+        super(DjangoCommon, self)._pre_setup()
+        if self.detect_n_plus_one:
+            request = self.client.request
+
+            def checked_request(**kwargs):
+                queries = capture_queries()
+                try:
+                    response = request(**kwargs)
+                finally:
+                    queries.stop()
+                self._check_n_plus_one(queries, kwargs.get('PATH_INFO'),
+                    self.n_plus_one_threshold)
+                return response
+
+            self.client.request = checked_request
+
     # A few useful helpers methods
 
     def login_as_admin(self):
@@ -230,6 +256,41 @@ class DjangoCommon(Common):
 
         return self.assert_model_changes(mod, lamb, **options)
 
+    def deny_n_plus_one(self, lamb, threshold=None):
+        '''
+        denies that the called block runs one statement over and over with
+        different values, and returns whatever the block returned
+
+        Pass it a client request to have the view named in the diagnostic.
+        '''
+
+        queries = capture_queries()
+        try:
+            response = lamb()
+        finally:
+            queries.stop()
+
+        path = None
+        request = getattr(response, 'request', None)
+        if isinstance(request, dict):
+            path = request.get('PATH_INFO')
+        self._check_n_plus_one(queries, path,
+            threshold or self.n_plus_one_threshold)
+        return response
+
+    def _check_n_plus_one(self, queries, path, threshold):
+        repeated = repeated_queries(queries, threshold)
+        if not repeated:
+            return
+        if path is None:
+            culprit = 'the called block'
+        else:
+            culprit = 'the view %s, for %s,' % (_view_name(path), path)
+        statements = '\n'.join(['%d times: %s' % (count, statement)
+            for statement, count in repeated])
+        self.fail('%s should not repeat a query for each row; it ran:\n%s' % (
+            culprit, statements))
+
     def assert_form_fields(self, form, context, *fields):
         '''
         ERGO This assertion may someday fix the problem that Django templates (correctly)
@@ -245,6 +306,16 @@ class DjangoCommon(Common):
 
         return moar  #  TODO  use this moar!
 
+def _view_name(path):
+    "Returns the dotted name of the view the path resolves to"
+    from django.core.urlresolvers import resolve, Resolver404
+    try:
+        view = resolve(path)[0]
+    except Resolver404:
+        return 'unknown'
+    return '%s.%s' % (getattr(view, '__module__', None),
+        getattr(view, '__name__', view.__class__.__name__))
+
 def _maybe_simplify(maybe_time):  #  ERGO  also fix comparisons on floats!
     import datetime
 
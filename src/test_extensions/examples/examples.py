@@ -109,4 +109,9 @@ class Examples(Common):
     def test_get_tables_that_should_exist(self):
         "Useful pattern for checking for the existence of all required tables"
         tables_that_exist = [row[0] for row in _execute("SHOW TABLES").fetchall()]
-        self.assert_equal(True, 'objects_object' in tables_that_exist)
\ No newline at end of file
+        self.assert_equal(True, 'objects_object' in tables_that_exist)
+
+    def test_query_budget(self):
+        "Demonstration of query budgets, which keep a view from growing extra queries"
+        self.assert_max_queries(5, lambda: self.client.get('/example/'))
+        self.assert_num_queries(1, lambda: list(Object.objects.all()))
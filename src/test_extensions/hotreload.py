@@ -0,0 +1,96 @@
+"""
+Reloads changed project modules in place, along with every module which
+imported something from them, so runtester --hot can rerun the suite
+without restarting the process.
+"""
+
+import sys
+
+from test_extensions.watcher import project_modules
+
+# Django keeps the first class it sees for each model, and settings are read
+# once at startup, so changes to these modules, or to anything in a package
+# of that name such as app.models.user, need a fresh process.
+RESTART_MODULES = ('models', 'settings')
+
+class RestartRequired(Exception):
+    pass
+
+def _imports(module, name):
+    "Tells whether module holds a reference to the module name or its contents"
+    target = sys.modules.get(name)
+    for value in module.__dict__.values():
+        try:
+            if value is target or getattr(value, '__module__', None) == name:
+                return True
+        except Exception:  # lazy objects may do anything on attribute access
+            continue
+    return False
+
+def _reloadable(name):
+    return not name.startswith('django') and \
+        not name.startswith('test_extensions')
+
+def importers_of(names, candidates):
+    """
+    Returns the candidate modules which imported any of the named modules,
+    directly or through another importer.
+    """
+    found = list(names)
+    pending = list(names)
+    while pending:
+        name = pending.pop(0)
+        for other in candidates:
+            if other not in found and _imports(sys.modules[other], name):
+                found.append(other)
+                pending.append(other)
+    return found[len(names):]
+
+def _reload_order(names):
+    """
+    Orders the modules so each is reloaded after the modules it imports
+    from, which means it picks up their new contents.
+    """
+    ordered = []
+    visiting = set()
+
+    def visit(name):
+        if name in ordered or name in visiting:
+            return
+        visiting.add(name)
+        for other in names:
+            if other != name and _imports(sys.modules[name], other):
+                visit(other)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+def plan_reload(filenames, root=None):
+    """
+    Returns the names of the modules to reload, in order, for the given
+    changed files. Raises RestartRequired if one of them can't be reloaded
+    in place.
+    """
+    modules = project_modules(root)
+    candidates = [name for name in modules.values() if _reloadable(name)]
+    names = [modules[filename] for filename in filenames
+        if filename in modules and modules[filename] in candidates]
+    names = names + importers_of(names, candidates)
+    for name in names:
+        if [part for part in name.split('.') if part in RESTART_MODULES]:
+            raise RestartRequired(name)
+    return _reload_order(names)
+
+def reload_modules(names):
+    for name in names:
+        reload(sys.modules[name])
+
+    # urlconfs may have been reloaded
+    try:
+        from django.core.urlresolvers import clear_url_caches
+    except ImportError:
+        pass
+    else:
+        clear_url_caches()
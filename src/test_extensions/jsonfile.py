@@ -0,0 +1,31 @@
+"""
+Saves the JSON files kept between runs, such as the duration history and
+the test map, so that a run which dies mid write, or another test process
+saving the same file, can't leave it half written.
+"""
+
+import os
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+def save_json(data, path, **options):
+    """
+    Writes data to path as JSON, with the given json.dump options. The file
+    is written under a name of this process's own and renamed into place.
+    The directory is created if need be.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temp_path = '%s.%d' % (path, os.getpid())
+    output = open(temp_path, 'w')
+    try:
+        json.dump(data, output, **options)
+    finally:
+        output.close()
+    if os.path.exists(path) and os.name == 'nt':
+        os.remove(path)  # rename doesn't replace files on Windows
+    os.rename(temp_path, path)
@@ -0,0 +1,130 @@
+"""
+Lets runtester put the tests which failed last time at the front of the
+next run, and stop a run as soon as it's been made stale by a save.
+
+The ids of the failing tests are kept in temp/lastfailed.json, since
+runtester restarts its process after most changes.
+"""
+
+import os
+import unittest
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from test_extensions.jsonfile import save_json
+
+FAILURES_FILE = os.path.join('temp', 'lastfailed.json')
+
+def load_failures(path=FAILURES_FILE):
+    if not os.path.exists(path):
+        return []
+    try:
+        return json.load(open(path))
+    except ValueError:
+        return []
+
+def save_failures(failures, path=FAILURES_FILE):
+    save_json(failures, path, indent=1)
+
+class RunController(object):
+    """
+    Hooks TestCase.run to record which tests fail and to skip the rest of
+    a cancelled run, and the text and xml runners to reorder their suites.
+    A cancelled run still finishes the test in progress and tears down the
+    test database as usual. uninstall() puts the originals back.
+    """
+    def __init__(self, path=FAILURES_FILE):
+        self.path = path
+        self.failed = load_failures(path)
+        self.cancelled = False
+        self._ran = []
+        self._failing = []
+        self._originals = []
+
+    def install(self):
+        from django.test import TestCase as DjangoTestCase
+        from test_extensions.testrunners.xmloutput import XMLTestRunner
+
+        controller = self
+        # the functions, as looking them up gives a new unbound method
+        self._originals = [(owner, owner.__dict__['run'])
+            for owner in (unittest.TestCase, unittest.TextTestRunner,
+                XMLTestRunner)]
+        run_test = unittest.TestCase.__dict__['run']
+
+        def run(test, result=None):
+            if result is None or not controller.cancelled:
+                return controller._run(run_test, test, result)
+            result.stop()
+
+        def wrap_runner(run_suite):
+            def run(runner, suite):
+                return run_suite(runner, controller.reorder(suite,
+                    DjangoTestCase))
+            return run
+
+        unittest.TestCase.run = run
+        unittest.TextTestRunner.run = wrap_runner(
+            unittest.TextTestRunner.__dict__['run'])
+        XMLTestRunner.run = wrap_runner(XMLTestRunner.__dict__['run'])
+
+    def uninstall(self):
+        "Takes the hooks install() put in out again"
+        for owner, run in self._originals:
+            owner.run = run
+        self._originals = []
+
+    def _run(self, run_test, test, result):
+        if result is not None:
+            problems = len(result.failures) + len(result.errors)
+        run_test(test, result)
+        if result is not None:
+            self._ran.append(test.id())
+            if len(result.failures) + len(result.errors) > problems:
+                self._failing.append(test.id())
+
+    def reorder(self, suite, first_class):
+        """
+        Moves the tests which failed last time to the front. Django runs
+        its TestCases before any other tests, since those can leave data
+        behind, so the failed tests only move within each of the groups.
+        """
+        if self.cancelled:
+            return unittest.TestSuite()
+        if not self.failed:
+            return suite
+        failed = set(self.failed)
+        tests = _flatten(suite)
+        tests.sort(key=lambda test: (not isinstance(test, first_class),
+            test.id() not in failed))
+        return unittest.TestSuite(tests)
+
+    def start(self):
+        self.cancelled = False
+        self._ran = []
+        self._failing = []
+
+    def cancel(self):
+        self.cancelled = True
+
+    def finish(self):
+        """
+        Remembers the tests which failed this run, and those which failed
+        before and weren't run this time.
+        """
+        ran = set(self._ran)
+        self.failed = [test_id for test_id in self.failed
+            if test_id not in ran] + self._failing
+        save_failures(self.failed, self.path)
+
+def _flatten(suite):
+    tests = getattr(suite, '_tests', None)
+    if tests is None:
+        return [suite]
+    flat = []
+    for test in tests:
+        flat.extend(_flatten(test))
+    return flat
@@ -0,0 +1,37 @@
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_extensions.testrunners.junit import report_path
+from test_extensions.testrunners.jsonlines import jsonl_to_junit
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--output', action='store', dest='output', default=None,
+            help='Where to write the report, by default next to the stream with an .xml extension'),
+        make_option('--name', action='store', dest='name', default='',
+            help='The name of the report'),
+    )
+    help = """Turns the JSON lines streamed by test --jsonl into a JUnit
+        xml report, such as test --xml writes. Tests the run never finished
+        are reported as errors. Defaults to temp/xml/test_output.jsonl."""
+    args = '[stream]'
+
+    requires_model_validation = False
+
+    def handle(self, *streams, **options):
+        if len(streams) > 1:
+            raise CommandError("Give one stream to convert")
+        stream = streams and streams[0] or report_path(None, 'jsonl')
+        if not os.path.isfile(stream):
+            raise CommandError("No stream at %s" % stream)
+        output = options['output'] or os.path.splitext(stream)[0] + '.xml'
+        try:
+            report = jsonl_to_junit(stream, output, options['name'])
+        except (KeyError, TypeError), e:
+            raise CommandError("%s isn't a stream written by test --jsonl: %r" % (
+                stream, e))
+        print >>sys.stderr, "Converted %d tests, %d errors and %d failures, into %s" % (
+            report.tests, report.errors, report.failures, report.path)
@@ -0,0 +1,46 @@
+import glob
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_extensions.testrunners.junit import REPORT_DIR, merge_reports
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--output', action='store', dest='output',
+            default=os.path.join(REPORT_DIR, 'merged.xml'),
+            help='Where to write the merged report'),
+        make_option('--name', action='store', dest='name', default='',
+            help='The name of the merged report'),
+    )
+    help = """Merges JUnit xml reports, such as the ones written by
+        test --xml --xml-per-app or by several shards, into one report,
+        one testcase at a time. Defaults to every report in temp/xml."""
+    args = '[report or glob ...]'
+
+    requires_model_validation = False
+
+    def handle(self, *reports, **options):
+        output = os.path.abspath(options['output'])
+        patterns = reports or [os.path.join(REPORT_DIR, '*.xml')]
+        paths = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise CommandError("No reports found for %s" % pattern)
+            for path in matches:
+                # the output of an earlier merge isn't merged into itself
+                if os.path.abspath(path) != output and path not in paths:
+                    paths.append(path)
+        if not paths:
+            raise CommandError("No reports to merge")
+
+        try:
+            merged = merge_reports(paths, options['output'], options['name'])
+        except SyntaxError, e:  # what cElementTree raises for bad xml
+            raise CommandError("Couldn't merge the reports: %s" % e)
+        print >>sys.stderr, "Merged %d reports, %d tests, %d errors and %d failures, into %s" % (
+            len(paths), merged.tests, merged.errors, merged.failures,
+            merged.path)
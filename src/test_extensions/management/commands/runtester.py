@@ -1,10 +1,21 @@
 from django.core.management.base import BaseCommand
 from django.utils import autoreload
-import os
+from optparse import make_option
 import sys
-import time
+import threading
+import traceback
+import Queue
 
-INPROGRESS_FILE = 'testing.inprogress'
+# Cleared while the test thread is running the suite
+_idle = threading.Event()
+_idle.set()
+
+# Records failures and cancels runs, see test_extensions.lastfailed
+_controller = None
+
+# Lists of modules to reload, passed from the reloader thread to the test
+# thread when running with --hot
+_hot_reloads = None
 
 def get_test_command():
     """
@@ -33,21 +44,58 @@ def my_reloader_thread():
 
     # If a file is saved while tests are being run, the base reloader just
     # kills the process.  This is bad because it wedges the database and then
-    # the user is prompted to delete the database.  Instead, wait for
-    # INPROGRESS_FILE to disappear, then exit.  Exiting the thread will then
-    # rerun the suite.
+    # the user is prompted to delete the database.  Instead, cancel the run,
+    # wait for the test thread to finish the test in progress and tear down
+    # the database, then exit.  Exiting the thread will then rerun the suite.
+    if _hot_reloads is not None:
+        return hot_reloader_thread()
     while autoreload.RUN_RELOADER:
+        # blocks until a file changes
         if autoreload.code_changed():
-            while os.path.exists(INPROGRESS_FILE):
-                time.sleep(1)
+            cancel_run()
+            wait_for_run()
             sys.exit(3) # force reload
-        time.sleep(1)
+
+def cancel_run():
+    "Stops the test run in progress, if any, after its current test"
+    if _controller is not None and not _idle.isSet():
+        print >>sys.stderr, "Files changed, cancelling the test run"
+        _controller.cancel()
+
+def wait_for_run():
+    "Waits for the test run in progress, if any, to finish"
+    while not _idle.isSet():
+        # a timeout keeps the wait interruptible with Ctrl-C
+        _idle.wait(1)
+
+def hot_reloader_thread():
+    """
+    Hand changed modules to the test thread to reload in place, and only
+    exit for a full restart when a change can't be reloaded.
+    """
+    from test_extensions import _error_files
+    from test_extensions.hotreload import plan_reload, RestartRequired
+    from test_extensions.watcher import get_watcher
+
+    watcher = get_watcher(extra_files=_error_files)
+    while autoreload.RUN_RELOADER:
+        changed = watcher.wait(timeout=1)
+        if changed:
+            cancel_run()
+            try:
+                _hot_reloads.put(plan_reload(changed))
+            except RestartRequired:
+                wait_for_run()
+                sys.exit(3) # force reload
 
 # monkeypatch the reloader_thread function with the one above
 autoreload.reloader_thread = my_reloader_thread
 
 class Command(BaseCommand):
-    option_list = BaseCommand.option_list
+    option_list = BaseCommand.option_list + (
+        make_option('--hot', action='store_true', dest='hot', default=False,
+            help='Reload changed modules and rerun the tests in the same process, keeping the test database'),
+    )
     help = "Starts a command that tests upon saving files."
     args = '[optional apps to test]'
 
@@ -55,17 +103,57 @@ class Command(BaseCommand):
     requires_model_validation = False
 
     def handle(self, *args, **options):
-        if os.path.exists(INPROGRESS_FILE):
-            os.remove(INPROGRESS_FILE)
+        global _hot_reloads, _controller
+        from test_extensions.lastfailed import RunController
+
+        # tests which failed last time are run first
+        _controller = RunController()
+        _controller.install()
 
         def inner_run():
             try:
-                open(INPROGRESS_FILE, 'wb').close()
+                _controller.start()
+                _idle.clear()
 
                 test_command = get_test_command()
                 test_command.handle(*args, **options)
             finally:
-                if os.path.exists(INPROGRESS_FILE):
-                    os.remove(INPROGRESS_FILE)
-
-        autoreload.main(inner_run)
+                _controller.finish()
+                _idle.set()
+
+        def hot_run():
+            from test_extensions.hotreload import reload_modules
+            from test_extensions.testrunners.database import hold_databases
+
+            hold_databases()
+            reloaded = True
+            while True:
+                if reloaded:
+                    try:
+                        inner_run()
+                    except SystemExit: # the test command exits with the failure count
+                        pass
+                    except Exception:
+                        traceback.print_exc()
+                names = _hot_reloads.get()
+                try:
+                    reload_modules(names)
+                    reloaded = True
+                    print >>sys.stderr, "Reloaded %s" % ', '.join(names)
+                except Exception:
+                    # wait for the next save to fix it
+                    traceback.print_exc()
+                    reloaded = False
+
+        try:
+            if options.get('hot'):
+                import atexit
+                from test_extensions.testrunners.database import release_databases
+                _hot_reloads = Queue.Queue()
+                atexit.register(release_databases)
+                autoreload.main(hot_run)
+            else:
+                autoreload.main(inner_run)
+        finally:
+            _controller.uninstall()
+            _controller = None
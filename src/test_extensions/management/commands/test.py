@@ -1,22 +1,44 @@
+import os
 import sys
+import time
+# taken before anything else is imported, for --profile-startup
+_import_started = time.time()
+import unittest
 from optparse import make_option
 
 from django.core import management
 from django.conf import settings
 from django.db.models import get_app, get_apps
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-# Django versions prior to 1.2 don't include the DjangoTestSuiteRunner class;
-# Django versions since 1.2 include multi-database support, which doesn't play
-# nicely with the database setup in the XML test runner.
-try:
-    from django.test.simple import DjangoTestSuiteRunner
-    xml_runner = 'test_extensions.testrunners.xmloutput.XMLTestSuiteRunner'
-except ImportError:  # We are in a version prior to 1.2
-    xml_runner = 'test_extensions.testrunners.xmloutput.run_tests'
+from test_extensions.testrunners import phases, registry
 
 skippers = []
 
+def report_first_test(started, verbosity):
+    """
+    Patches TestCase.run to print the time from started to the first test.
+    Returns a function which removes the patch again.
+    """
+    run = unittest.TestCase.__dict__['run']
+    pid = os.getpid()
+
+    def restore():
+        # TestCase.run is a new unbound method each time it's looked up
+        if unittest.TestCase.__dict__['run'] is first_run:
+            unittest.TestCase.run = run
+
+    def first_run(test, result=None):
+        restore()
+        # parallel workers are forked from this process
+        if os.getpid() == pid and verbosity >= 1:
+            print >>sys.stderr, "Started the first test after %.3fs" % (
+                time.time() - started)
+        return run(test, result)
+
+    unittest.TestCase.run = first_run
+    return restore
+
 class Command(BaseCommand):
     option_list = BaseCommand.option_list
 
@@ -45,11 +67,66 @@ class Command(BaseCommand):
             help='Produce figleaf coverage report'),
         make_option('--xml', action='store_true', dest='xml', default=False,
             help='Produce JUnit-type xml output'),
+        make_option('--xml-per-app', action='store_true', dest='xml_per_app',
+            default=False,
+            help='With --xml, write a report for each app, temp/xml/TEST-<app>.xml, rather than one for the run'),
+        make_option('--xml-suffix', action='store', dest='xml_suffix',
+            default=None,
+            help='Add a suffix to the names of the xml reports, so several processes or machines can write them side by side; defaults to the shard'),
         make_option('--nodb', action='store_true', dest='nodb', default=False,
             help='No database required for these tests'),
         make_option('--failfast', action='store_true', dest='failfast',
             default=False,
             help='Tells Django to stop running the test suite after first failed test.'),
+        make_option('--parallel', action='store', dest='parallel', default=0,
+            type='int',
+            help='Run the tests of each TestCase class in one of N worker processes'),
+        make_option('--shard', action='store', dest='shard', default=None,
+            help='Only run the Kth of N shards of the suite, given as K/N'),
+        make_option('--shard-durations', action='store',
+            dest='shard_durations', default=None,
+            help='A durations file every shard shares, such as a committed copy of temp/durations.json, to load the shards evenly; without one classes are split by a hash of their names'),
+        make_option('--keepdb', action='store_true', dest='keepdb',
+            default=False,
+            help='Reuse the test database between runs while the schema is unchanged'),
+        make_option('--testmap', action='store_true', dest='testmap',
+            default=False,
+            help='With --coverage or --xmlcoverage, record the source files each test runs'),
+        make_option('--changed-since', action='store', dest='changed_since',
+            default=None,
+            help='Only run tests which ran files changed since the given git revision, or which are new'),
+        make_option('--runner', action='store', dest='runner', default=None,
+            help='Use the named test runner, including ones installed through the test_extensions.runners entry point'),
+        make_option('--profile-startup', action='store_true',
+            dest='profile_startup', default=False,
+            help='Print the time and peak memory taken by each phase of the run, and save them to temp/profile_startup.json'),
+        make_option('--profile', action='store_true', dest='profile',
+            default=False,
+            help='Profile each test, saving the merged stats and the hottest functions of each TestCase class to temp/profile'),
+        make_option('--profile-top', action='store', dest='profile_top',
+            default=10, type='int',
+            help='How many functions to list for each TestCase class with --profile'),
+        make_option('--memory', action='store_true', dest='memory',
+            default=False,
+            help='Measure the memory and objects each test keeps after tearDown, listing the worst tests and TestCase classes'),
+        make_option('--memory-top', action='store', dest='memory_top',
+            default=10, type='int',
+            help='How many tests and classes to list with --memory'),
+        make_option('--benchmark-baseline', action='store_true',
+            dest='benchmark_baseline', default=False,
+            help='Save the timings of BenchmarkCommon benchmarks as their new baseline rather than comparing with it'),
+        make_option('--jsonl', action='store_true', dest='jsonl',
+            default=False,
+            help='Stream the results to temp/xml/test_output.jsonl, a JSON line as each test starts and stops; jsonltoxml turns it into a JUnit report'),
+        make_option('--live', action='store_true', dest='live',
+            default=False,
+            help='Publish each test as it starts and stops over a Unix domain socket, for the watchtests command'),
+        make_option('--live-socket', action='store', dest='live_socket',
+            default=None,
+            help='The socket to publish on with --live, temp/live.sock by default'),
+        make_option('--slowest', action='store', dest='slowest', default=0,
+            type='int',
+            help='Print the N slowest tests with their change from the median of their recent runs, flagging ones which got slower'),
 
     )
     help = """Custom test command which allows for
@@ -59,12 +136,39 @@ class Command(BaseCommand):
     requires_model_validation = True
 
     def handle(self, *test_labels, **options):
+        started = time.time()
+        if options.get('profile_startup'):
+            global _import_started
+            # only the first run in a process paid for the import
+            phases.enable(_import_started)
+            _import_started = None
+        try:
+            failures = self.run_tests(started, *test_labels, **options)
+        finally:
+            phases.report()
+
+        if failures:
+            sys.exit(failures)
 
+    def run_tests(self, started, *test_labels, **options):
+        "Runs the tests, returning the number of failures"
         verbosity = int(options.get('verbosity', 1))
         interactive = options.get('interactive', True)
         callgraph = options.get('callgraph', False)
         failfast = options.get("failfast", False)
+        parallel = int(options.get('parallel') or 0)
+        shard = None
+        if options.get('shard'):
+            from test_extensions.testrunners.scheduling import parse_shard
+            try:
+                shard = parse_shard(options['shard'])
+            except ValueError, e:
+                raise CommandError(str(e))
+        shard_durations = options.get('shard_durations')
+        if shard_durations and not os.path.exists(shard_durations):
+            raise CommandError("No durations file at %s" % shard_durations)
 
+        phases.start('syncdb override')
         # it's quite possible someone, lets say South, might have stolen
         # the syncdb command from django. For testing purposes we should
         # probably put it back. Migrations don't really make sense
@@ -72,44 +176,95 @@ class Command(BaseCommand):
         management.get_commands()
         management._commands['syncdb'] = 'django.core'
 
-        if options.get('nodb'):
-            if options.get('xmlcoverage'):
-                test_runner_name = 'test_extensions.testrunners.nodatabase.run_tests_with_xmlcoverage'
-            elif options.get('coverage'):
-                test_runner_name = 'test_extensions.testrunners.nodatabase.run_tests_with_coverage'
+        # set for every run, runtester's included
+        from test_extensions.testrunners.junit import name_reports
+        xml_suffix = options.get('xml_suffix')
+        if xml_suffix is None and shard:
+            xml_suffix = 'shard%dof%d' % shard
+        name_reports(per_app=options.get('xml_per_app', False),
+            suffix=xml_suffix)
+
+        if options.get('keepdb'):
+            from test_extensions.testrunners.database import keep_databases
+            keep_databases()
+        phases.stop()
+
+        phases.start('runner import')
+        runner_name = registry.select_runner(options)
+
+        if parallel > 1 or shard:
+            if options.get('coverage') or options.get('xmlcoverage') or \
+                    options.get('figleaf'):
+                print >>sys.stderr, "--parallel and --shard can't be combined with coverage; running all tests serially"
+                parallel = 0
+                shard = None
+            elif options.get('runner'):
+                print >>sys.stderr, "--parallel and --shard can't be combined with --runner; running all tests serially"
+                parallel = 0
+                shard = None
             else:
-                test_runner_name = 'test_extensions.testrunners.nodatabase.run_tests'
-        elif options.get('xmlcoverage'):
-            test_runner_name = 'test_extensions.testrunners.codecoverage.run_tests_xml'
-        elif options.get ('coverage'):
-            test_runner_name = 'test_extensions.testrunners.codecoverage.run_tests'
-        elif options.get('figleaf'):
-            test_runner_name = 'test_extensions.testrunners.figleafcoverage.run_tests'
-        elif options.get('xml'):
-            test_runner_name = xml_runner
-        else:
-            test_runner_name = settings.TEST_RUNNER
+                runner_name = 'parallel'
 
-        test_path = test_runner_name.split('.')
-        # Allow for Python 2.5 relative paths
-        if len(test_path) > 1:
-            test_module_name = '.'.join(test_path[:-1])
+        # runners are only imported once picked, so a plain run doesn't
+        # import coverage or figleaf
+        if runner_name is None:
+            runner_path = settings.TEST_RUNNER
+            test_runner = registry.import_runner(runner_path)
         else:
-            test_module_name = '.'
-        test_module = __import__(test_module_name, {}, {}, test_path[-1])
-        test_runner = getattr(test_module, test_path[-1])
+            runner_path = registry.RUNNERS.get(runner_name)
+            try:
+                test_runner = registry.get_runner(runner_name)
+            except KeyError:
+                raise CommandError("Unknown test runner %s, choose from %s" % (
+                    runner_name, ', '.join(registry.runner_names())))
+        phases.stop()
+
+        phases.start('discovery')
+        from test_extensions.testrunners.discovery import DiscoveryIndex
+        index = DiscoveryIndex()
+
+        # other runners may take labels of their own
+        if test_labels and registry.takes_django_labels(runner_path):
+            # check the labels before spending time on the test database
+            unknown = index.unknown_labels(test_labels)
+            if unknown:
+                index.save()
+                raise CommandError("No app or test found for %s" % ', '.join(unknown))
 
         if hasattr(settings, 'SKIP_TESTS'):
             if not test_labels:
                 test_labels = list()
                 for app in get_apps():
-                    test_labels.append(app.__name__.split('.')[-2])
+                    # apps without tests needn't be imported at all
+                    if index.has_tests(app):
+                        test_labels.append(app.__name__.split('.')[-2])
             for app in settings.SKIP_TESTS:
                 try:
                     test_labels = list(test_labels)
                     test_labels.remove(app)
                 except ValueError:
                     pass
+
+        if options.get('changed_since'):
+            from test_extensions.testrunners.testmap import select_tests
+            try:
+                selected, considered, unmapped = select_tests(
+                    options['changed_since'], test_labels, index=index)
+            except ValueError, e:
+                raise CommandError(str(e))
+            if unmapped:
+                names = ', '.join(unmapped[:3]) + (len(unmapped) > 3 and ', ...' or '')
+                print >>sys.stderr, "Running all %d tests, as no test in the map ran %s, changed since %s" % (
+                    considered, names, options['changed_since'])
+            elif verbosity >= 1:
+                print >>sys.stderr, "Running %d of %d tests affected by changes since %s" % (
+                    len(selected), considered, options['changed_since'])
+            if not selected:
+                return 0
+            test_labels = selected
+
+        index.save()
+        phases.stop()
                     
         test_options = dict(verbosity=verbosity,
             interactive=interactive)
@@ -119,11 +274,107 @@ class Command(BaseCommand):
 
         if options.get('coverage'):
             test_options["callgraph"] = callgraph
+
+        if options.get('testmap'):
+            if (options.get('coverage') or options.get('xmlcoverage')) and \
+                    not options.get('nodb'):
+                test_options["test_map"] = True
+            else:
+                print >>sys.stderr, "--testmap needs --coverage or --xmlcoverage with a database; no map recorded"
+
+        if parallel > 1 or shard:
+            test_options["parallel"] = max(parallel, 1)
+            test_options["shard"] = shard
+            test_options["shard_durations"] = shard_durations
+            test_options["xml"] = options.get('xml', False)
+            test_options["nodatabase"] = options.get('nodb', False)
         
+        # started first so it hears of each test stopping last, after the
+        # other listeners have given the test their figures
+        jsonl = None
+        if options.get('jsonl'):
+            from test_extensions.testrunners.capture import OUTPUT_LIMIT
+            from test_extensions.testrunners.jsonlines import JsonLinesRecorder
+            jsonl = JsonLinesRecorder(limit=getattr(settings,
+                'TEST_OUTPUT_LIMIT', OUTPUT_LIMIT))
+            jsonl.start()
+
+        profiler = None
+        if options.get('profile'):
+            if parallel > 1 or shard:
+                print >>sys.stderr, "--profile can't be combined with --parallel or --shard; not profiling"
+            elif test_options.get('test_map'):
+                # both need the interpreter's one profile hook
+                print >>sys.stderr, "--profile can't be combined with --testmap; not profiling"
+            else:
+                from test_extensions.testrunners.profiling import TestProfiler
+                profiler = TestProfiler(top=int(options.get('profile_top') or 10))
+                profiler.start()
+
+        memory = None
+        if options.get('memory'):
+            if parallel > 1 or shard:
+                print >>sys.stderr, "--memory can't be combined with --parallel or --shard; not measuring"
+            else:
+                from test_extensions.testrunners.memory import MemoryRecorder
+                memory = MemoryRecorder(top=int(options.get('memory_top') or 10))
+                memory.start()
+
+        baseline = False
+        if options.get('benchmark_baseline'):
+            if parallel > 1 or shard:
+                print >>sys.stderr, "--benchmark-baseline can't be combined with --parallel or --shard; comparing with the baseline"
+            else:
+                from test_extensions import benchmark_common
+                benchmark_common.record_baselines()
+                baseline = True
+
+        from test_extensions.testrunners.history import HistoryRecorder, \
+            print_slowest
+        # every run is kept, so --slowest has something to compare with
+        history = HistoryRecorder()
+        history.start()
+
+        live = None
+        if options.get('live') or options.get('live_socket'):
+            from test_extensions.testrunners.live import LivePublisher, \
+                SOCKET_FILE
+            live = LivePublisher(options.get('live_socket') or SOCKET_FILE)
+            if live.start():
+                print >>sys.stderr, "Publishing the run on %s" % live.path
+            else:
+                live = None
+
+        restore = report_first_test(started, verbosity)
+        # time in the runner which none of the phases it goes through
+        # account for
+        phases.start('runner (other)')
         try:
-            failures = test_runner(test_labels, **test_options)
-        except TypeError: #Django 1.2
-            failures = test_runner(**test_options).run_tests(test_labels)
-        
-        if failures:
-            sys.exit(failures)
+            try:
+                failures = test_runner(test_labels, **test_options)
+            except TypeError: #Django 1.2
+                failures = test_runner(**test_options).run_tests(test_labels)
+        finally:
+            phases.stop()
+            restore()
+            if live is not None:
+                live.stop()
+            history.stop()
+            if memory is not None:
+                memory.stop()
+            if profiler is not None:
+                profiler.stop()
+                for path in profiler.save():
+                    print >>sys.stderr, "Profile written to %s" % path
+            if jsonl is not None:
+                jsonl.stop()
+                print >>sys.stderr, "Results streamed to %s" % jsonl.path
+            if memory is not None:
+                memory.report()
+            if baseline:
+                for path in benchmark_common.save_baselines():
+                    print >>sys.stderr, "Benchmark baseline written to %s" % path
+            run_id = history.save()
+        if run_id is not None and options.get('slowest'):
+            print_slowest(run_id, int(options['slowest']))
+        return failures
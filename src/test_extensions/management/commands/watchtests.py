@@ -0,0 +1,37 @@
+import socket
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_extensions.testrunners.live import SOCKET_FILE, watch
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', action='store', dest='interval',
+            default=1.0, type='float',
+            help='Seconds between updates when not on a terminal'),
+        make_option('--nowait', action='store_false', dest='wait',
+            default=True,
+            help="Fail rather than wait when no run is publishing"),
+    )
+    help = """Follows a test run started with test --live, showing how
+        many tests have run, the ETA, the test which has been running
+        longest and each test as it fails."""
+    args = '[socket]'
+
+    requires_model_validation = False
+
+    def handle(self, *sockets, **options):
+        if len(sockets) > 1:
+            raise CommandError("Give one socket to watch")
+        path = sockets and sockets[0] or SOCKET_FILE
+        try:
+            finished = watch(path, sys.stdout, options['interval'],
+                options['wait'])
+        except KeyboardInterrupt:
+            return
+        except socket.error, e:
+            raise CommandError("Couldn't watch %s: %s" % (path, e))
+        if not finished:
+            sys.exit(1)
@@ -0,0 +1,137 @@
+"""
+Records the SQL run through each database connection.
+
+Django only keeps connection.queries while settings.DEBUG is on, and the
+test runners switch it off, so the connections' cursors are wrapped here
+instead. Nothing is recorded, or timed, unless a capture is running.
+"""
+
+import re
+import time
+
+from test_extensions.testrunners.database import get_connections
+
+_captures = []
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+class CapturedQueries(object):
+    """
+    The queries run between capture_queries() and stop(), as dicts with
+    the sql, its params, the time it took in seconds and the alias of the
+    connection.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __iter__(self):
+        return iter(self.queries)
+
+    def __getitem__(self, index):
+        return self.queries[index]
+
+    def time(self):
+        "Returns the total time the queries took, in seconds"
+        return sum([query['time'] for query in self.queries])
+
+    def stop(self):
+        if self in _captures:
+            _captures.remove(self)
+        return self
+
+def _record(connection, cursor, sql, params, seconds):
+    try:
+        executed = connection.ops.last_executed_query(cursor, sql, params)
+    except Exception:  # only a nicety, some backends can't do it for every query
+        executed = sql
+    query = {'sql': executed, 'params': params, 'time': seconds,
+        'alias': getattr(connection, 'alias', 'default')}
+    for capture in _captures:
+        capture.queries.append(query)
+
+class CaptureCursorWrapper(object):
+    def __init__(self, cursor, connection):
+        self.cursor = cursor
+        self.connection = connection
+
+    def execute(self, sql, params=()):
+        if not _captures:
+            return self.cursor.execute(sql, params)
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            _record(self.connection, self.cursor, sql, params,
+                time.time() - start)
+
+    def executemany(self, sql, param_list):
+        if not _captures:
+            return self.cursor.executemany(sql, param_list)
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            _record(self.connection, self.cursor, sql, param_list,
+                time.time() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+def install():
+    "Wraps the cursors of every connection, once"
+    for connection in get_connections():
+        if getattr(connection, '_capturing_cursors', False):
+            continue
+        def cursor(cursor=connection.cursor, connection=connection):
+            return CaptureCursorWrapper(cursor(), connection)
+        connection.cursor = cursor
+        connection._capturing_cursors = True
+
+def capture_queries():
+    """
+    Starts recording queries. Returns a CapturedQueries which collects them
+    until its stop() is called; captures can overlap.
+    """
+    install()
+    capture = CapturedQueries()
+    _captures.append(capture)
+    return capture
+
+def normalize_sql(sql):
+    """
+    Replaces the literal values and parameters in a statement with ?, and
+    lists of them with (...), so statements which only differ in values
+    come out the same.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+def repeated_queries(queries, threshold=3):
+    """
+    Returns (statement, count) for the statements run at least threshold
+    times with different values, the N+1 pattern, most repeated first.
+    """
+    counts = {}
+    variants = {}
+    for query in queries:
+        statement = normalize_sql(query['sql'])
+        counts[statement] = counts.get(statement, 0) + 1
+        variants.setdefault(statement, set()).add(
+            (query['sql'], repr(query.get('params'))))
+    repeated = [(statement, count) for statement, count in counts.items()
+        if count >= threshold and len(variants[statement]) > 1]
+    repeated.sort(key=lambda item: item[1], reverse=True)
+    return repeated
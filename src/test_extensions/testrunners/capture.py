@@ -0,0 +1,104 @@
+"""
+Captures what the tests write to stdout and stderr, test by test, for the
+xml report.
+
+Everything written still goes through to the real stream. A copy of what
+each test writes is kept, up to a limit, in a buffer which moves to a
+temporary file once it outgrows memory, so chatty tests neither fill the
+memory nor slow the run down. Output written outside any test is kept the
+same way for the report as a whole.
+"""
+
+import tempfile
+
+# how much of each test's output is kept, and of the output outside tests;
+# settings.TEST_OUTPUT_LIMIT overrides it
+OUTPUT_LIMIT = 1024 * 1024
+
+# how big a buffer gets before it's moved to disk
+SPOOL_BYTES = 64 * 1024
+
+class _Spool(object):
+    "Keeps up to limit bytes of what's written to it"
+    def __init__(self, limit):
+        self.limit = limit
+        self.kept = 0
+        self.dropped = 0
+        try:
+            self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        except AttributeError:  # We are in a version prior to Python 2.6
+            self.file = tempfile.TemporaryFile()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        room = self.limit - self.kept
+        if room > 0:
+            self.file.write(data[:room])
+            self.kept += min(room, len(data))
+        self.dropped += max(len(data) - max(room, 0), 0)
+
+    def getvalue(self):
+        self.file.seek(0)
+        value = self.file.read().decode('utf-8', 'replace')
+        if self.dropped:
+            value += u'\n[%d more bytes of output not kept]\n' % self.dropped
+        return value
+
+    def close(self):
+        self.file.close()
+
+class OutputCapture(object):
+    """
+    Stands in for sys.stdout or sys.stderr, passing everything through to
+    the stream it replaced and keeping a copy for the test running, or for
+    the run when there isn't one.
+    """
+    def __init__(self, stream, limit=OUTPUT_LIMIT):
+        self.stream = stream
+        self.limit = limit
+        self._run = _Spool(limit)
+        self._test = None
+
+    def write(self, string):
+        self.stream.write(string)
+        (self._test or self._run).write(string)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+    def start_test(self):
+        if self._test is not None:
+            self._test.close()
+        self._test = _Spool(self.limit)
+
+    def stop_test(self):
+        "Returns what was written since start_test()"
+        if self._test is None:
+            return u''
+        test, self._test = self._test, None
+        try:
+            return test.getvalue()
+        finally:
+            test.close()
+
+    def read(self):
+        "Returns what was written outside the tests"
+        return self._run.getvalue()
+
+    def reset(self):
+        self._run.close()
+        self._run = _Spool(self.limit)
+
+    def close(self):
+        if self._test is not None:
+            self._test.close()
+            self._test = None
+        self._run.close()
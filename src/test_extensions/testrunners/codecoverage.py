@@ -8,6 +8,8 @@ from django.db.models import get_app, get_apps
 from django.utils.functional import curry
 
 from nodatabase import run_tests as nodatabase_run_tests
+from testmap import TestFileRecorder
+import phases
 
 def is_wanted_module(mod):
     included = getattr(settings, "COVERAGE_INCLUDE_MODULES", [])
@@ -88,10 +90,12 @@ def get_all_coverage_modules(app_module):
     return mod_list
 
 def run_tests(test_labels, verbosity=1, interactive=True,
-        extra_tests=[], nodatabase=False, xml_out=False, callgraph=False):
+        extra_tests=[], nodatabase=False, xml_out=False, callgraph=False,
+        test_map=False):
     """
     Test runner which displays a code coverage report at the end of the
-    run.
+    run. With test_map the source files each test executes are recorded
+    too, for use by test --changed-since.
     """
     cov = coverage.coverage()
     cov.erase()
@@ -144,6 +148,10 @@ def run_tests(test_labels, verbosity=1, interactive=True,
     if pycallgraph_enabled:
         pycallgraph.start_trace(filter_func=_filter_func)
 
+    if test_map:
+        recorder = TestFileRecorder()
+        recorder.start()
+
     if nodatabase:
         results = nodatabase_run_tests(test_labels, verbosity, interactive,
             extra_tests)
@@ -151,10 +159,15 @@ def run_tests(test_labels, verbosity=1, interactive=True,
         results = django_test_runner(test_labels, verbosity, interactive,
             extra_tests)
     
+    if test_map:
+        recorder.stop()
+        recorder.save()
+
     if callgraph and pycallgraph_enabled:
         pycallgraph.stop_trace()
 
     cov.stop()
+    phases.start('coverage reporting')
     
     report_methd = cov.report
     if getattr(settings, "COVERAGE_HTML_REPORT", False) or \
@@ -188,10 +201,12 @@ def run_tests(test_labels, verbosity=1, interactive=True,
 
         cov.report(coverage_modules, show_missing=1)
 
+    phases.stop()
     return results
 
 
 def run_tests_xml (test_labels, verbosity=1, interactive=True,
-        extra_tests=[], nodatabase=False):
+        extra_tests=[], nodatabase=False, callgraph=False, test_map=False):
     return run_tests(test_labels, verbosity, interactive,
-               extra_tests, nodatabase, xml_out=True)
+               extra_tests, nodatabase, xml_out=True, callgraph=callgraph,
+               test_map=test_map)
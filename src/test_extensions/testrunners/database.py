@@ -0,0 +1,492 @@
+"""
+Helpers for creating and destroying test databases which work with both
+the single database settings of Django < 1.2 and the per connection
+settings dictionaries of Django 1.2.
+"""
+
+import os
+import shutil
+import sys
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils.functional import curry
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import md5_constructor
+
+from test_extensions.jsonfile import save_json
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+TEST_DATABASE_PREFIX = 'test_'
+FINGERPRINTS_FILE = os.path.join('temp', 'keepdb.json')
+TEMPLATE_DIRECTORY = 'temp'
+
+def _multi_db():
+    "Tells whether the connections have the settings dictionaries of Django 1.2"
+    try:
+        from django.db import connections
+    except ImportError:  # We are in a version prior to 1.2
+        return False
+    return True
+
+def get_connections():
+    "Returns every configured database connection"
+    try:
+        from django.db import connections
+    except ImportError:  # We are in a version prior to 1.2
+        from django.db import connection
+        return [connection]
+    return [connections[alias] for alias in connections]
+
+def close_connections():
+    """
+    Closes every open connection. Database sockets must never be shared
+    between processes, so call this before forking.
+    """
+    for connection in get_connections():
+        connection.close()
+
+def is_sqlite(connection):
+    return (_get_setting(connection, 'ENGINE') or '').endswith('sqlite3')
+
+def is_postgresql(connection):
+    engine = _get_setting(connection, 'ENGINE') or ''
+    return 'postgresql' in engine or 'postgis' in engine
+
+def can_clone(connection):
+    "Tells whether a test database on this connection can be copied"
+    return is_sqlite(connection) or is_postgresql(connection)
+
+def _get_setting(connection, key):
+    if _multi_db():
+        return connection.settings_dict.get(key)
+    # Django 1.1 connections have a settings_dict too, but keyed DATABASE_*
+    # and without the engine, so settings is the one to read
+    return getattr(settings, 'DATABASE_' + key, None)
+
+def get_database_name(connection):
+    return _get_setting(connection, 'NAME')
+
+def set_database_name(connection, name):
+    if _multi_db():
+        connection.settings_dict['NAME'] = name
+        return
+    settings.DATABASE_NAME = name
+    # what the Django 1.1 connection connects to
+    settings_dict = getattr(connection, 'settings_dict', None)
+    if settings_dict is not None:
+        settings_dict['DATABASE_NAME'] = name
+
+def _get_test_name_setting(connection):
+    if _multi_db():
+        return connection.settings_dict.get('TEST_NAME')
+    return getattr(settings, 'TEST_DATABASE_NAME', None)
+
+def get_test_database_name(connection):
+    "Returns the name create_test_db will use for the given connection"
+    name = _get_test_name_setting(connection)
+    if name:
+        return name
+    if is_sqlite(connection):
+        return ':memory:'
+    return TEST_DATABASE_PREFIX + get_database_name(connection)
+
+def set_test_database_name(connection, name):
+    if _multi_db():
+        connection.settings_dict['TEST_NAME'] = name
+    else:
+        settings.TEST_DATABASE_NAME = name
+
+def get_worker_database_name(connection, suffix):
+    """
+    Returns a test database name unique to a worker process. In memory
+    SQLite databases are already private to the process that opens them.
+    """
+    name = get_test_database_name(connection)
+    if name == ':memory:':
+        return name
+    return '%s_%s' % (name, suffix)
+
+def _report(verbosity, message):
+    if verbosity >= 1:
+        print >>sys.stderr, message
+
+def create_test_database(connection, verbosity=1, interactive=True):
+    "Runs create_test_db, reporting how long it took"
+    startTime = time.time()
+    name = connection.creation.create_test_db(verbosity,
+        autoclobber=not interactive)
+    _report(verbosity, "Created test database '%s' in %.3fs" % (
+        get_database_name(connection), time.time() - startTime))
+    return name
+
+def _execute_outside_test_database(connection, old_name, *statements):
+    """
+    Runs statements, such as CREATE DATABASE, which can't be run inside a
+    transaction or while connected to the databases they affect.
+    """
+    current_name = get_database_name(connection)
+    connection.close()
+    set_database_name(connection, old_name)
+    try:
+        cursor = connection.cursor()
+        connection.creation.set_autocommit()
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        connection.close()
+        set_database_name(connection, current_name)
+
+def clone_test_database(connection, template_name, target_name, old_name,
+        verbosity=1):
+    """
+    Copies the test database template_name to target_name, which is much
+    quicker than running syncdb again. SQLite files are copied, PostgreSQL
+    databases are created with the template as their TEMPLATE. Any
+    existing target_name is replaced.
+    """
+    startTime = time.time()
+    if is_sqlite(connection):
+        connection.close()
+        shutil.copyfile(template_name, target_name)
+    else:
+        qn = connection.ops.quote_name
+        _execute_outside_test_database(connection, old_name,
+            'DROP DATABASE IF EXISTS %s' % qn(target_name),
+            'CREATE DATABASE %s WITH TEMPLATE %s' % (qn(target_name),
+                qn(template_name)))
+    _report(verbosity, "Cloned test database '%s' to '%s' in %.3fs" % (
+        template_name, target_name, time.time() - startTime))
+
+def drop_test_database(connection, name, old_name):
+    """
+    Drops a cloned test database. Unlike destroy_test_db this doesn't wait
+    before dropping or go through --keepdb.
+    """
+    if is_sqlite(connection):
+        connection.close()
+        if name != ':memory:' and os.path.exists(name):
+            os.remove(name)
+    else:
+        _execute_outside_test_database(connection, old_name,
+            'DROP DATABASE IF EXISTS %s' % connection.ops.quote_name(name))
+
+def load_memory_database(connection, template_name):
+    """
+    Opens a new in memory SQLite database on the connection and fills it
+    from a template file, for worker processes of an in memory test run.
+    """
+    import sqlite3
+    connection.close()
+    set_database_name(connection, ':memory:')
+    connection.cursor()
+    template = sqlite3.connect(template_name)
+    connection.connection.executescript('\n'.join(template.iterdump()))
+    template.close()
+
+def _clone_source(connection, created):
+    """
+    Returns an already created test database this connection's test
+    database can be cloned from. Cloning is only safe when both hold the
+    same tables, which without routers they always do.
+    """
+    if getattr(settings, 'DATABASE_ROUTERS', None) or not can_clone(connection):
+        return None
+    for other, old_name in created:
+        if get_database_name(other) == ':memory:':
+            continue
+        if _get_setting(other, 'ENGINE') == _get_setting(connection, 'ENGINE') \
+                and _get_setting(other, 'HOST') == _get_setting(connection, 'HOST') \
+                and _get_setting(other, 'PORT') == _get_setting(connection, 'PORT'):
+            return other
+    return None
+
+def _record_transaction_support(connection):
+    "Records whether the test database can roll back, as create_test_db does"
+    if not hasattr(connection.creation, '_rollback_works'):
+        return
+    # TestCase reads this
+    if _multi_db():
+        connection.settings_dict['SUPPORTS_TRANSACTIONS'] = \
+            connection.creation._rollback_works()
+    else:
+        settings.DATABASE_SUPPORTS_TRANSACTIONS = \
+            connection.creation._rollback_works()
+
+def setup_databases(verbosity=1, interactive=True, suffix=None,
+        connections=None):
+    """
+    Creates a test database for every connection, optionally with a name
+    suffixed for a worker process. Where several test databases live on
+    the same server only the first is built with syncdb and the others
+    are cloned from it. A TEST_MIRROR connection is replaced by the one it
+    mirrors for the run, as Django 1.2 does, so it sees the same data.
+    Returns the state needed by teardown_databases: (connection, name to
+    restore) pairs, with the alias to restore for a mirror.
+    """
+    old_names = []
+    mirrors = []
+    if connections is None:
+        connections = get_connections()
+    for connection in connections:
+        old_name = get_database_name(connection)
+        if _get_setting(connection, 'TEST_MIRROR'):
+            mirrors.append((connection, connection.alias))
+            continue
+        if suffix is not None:
+            set_test_database_name(connection,
+                get_worker_database_name(connection, suffix))
+        source = _clone_source(connection, old_names)
+        target_name = get_test_database_name(connection)
+        if source is not None and target_name != ':memory:':
+            # PostgreSQL won't copy a database anyone is connected to
+            source.close()
+            clone_test_database(connection, get_database_name(source),
+                target_name, old_name, verbosity)
+            set_database_name(connection, target_name)
+            _record_transaction_support(connection)
+        else:
+            create_test_database(connection, verbosity, interactive)
+        old_names.append((connection, old_name))
+
+    if mirrors:
+        # TEST_MIRROR, and so mirrors, only came with Django 1.2
+        from django.db import connections as all_connections
+        for connection, alias in mirrors:
+            all_connections._connections[alias] = \
+                all_connections[_get_setting(connection, 'TEST_MIRROR')]
+    return old_names + mirrors
+
+def teardown_databases(old_names, verbosity=1):
+    for connection, old_name in old_names:
+        if _get_setting(connection, 'TEST_MIRROR'):
+            # the mirror gets its own connection back
+            from django.db import connections as all_connections
+            all_connections._connections[old_name] = connection
+        else:
+            connection.creation.destroy_test_db(old_name, verbosity)
+
+def setup_worker_databases(numbers, verbosity=1, interactive=True):
+    """
+    Creates the test database of each connection once, as a template, then
+    clones it for each worker number. Connections whose backend can't be
+    cloned are left for the workers to create themselves.
+
+    Returns (templates, clones); clones maps each worker number to the
+    (connection, name, template) triples use_worker_databases expects.
+    """
+    templates = []
+    clones = dict([(number, []) for number in numbers])
+    for connection in get_connections():
+        # mirrors are left to the workers, which point them at their clones
+        if not can_clone(connection) or _get_setting(connection, 'TEST_MIRROR'):
+            continue
+        old_name = get_database_name(connection)
+        old_test_name = _get_test_name_setting(connection)
+        in_memory = get_test_database_name(connection) == ':memory:'
+        if in_memory:
+            # the template has to outlive this process, so keep it in a file
+            if not os.path.isdir(TEMPLATE_DIRECTORY):
+                os.makedirs(TEMPLATE_DIRECTORY)
+            set_test_database_name(connection, os.path.join(TEMPLATE_DIRECTORY,
+                '%stemplate_%s.sqlite3' % (TEST_DATABASE_PREFIX, len(templates))))
+        create_test_database(connection, verbosity, interactive)
+        template = get_database_name(connection)
+        templates.append((connection, old_name, old_test_name))
+        for number in numbers:
+            if in_memory:
+                name = ':memory:'
+            else:
+                name = '%s_%s' % (template, number)
+                clone_test_database(connection, template, name, old_name,
+                    verbosity)
+            clones[number].append((connection, name, template))
+        connection.close()
+    return templates, clones
+
+def use_worker_databases(clones):
+    "Points a worker's connections at its clones of the template databases"
+    for connection, name, template in clones:
+        if name == ':memory:':
+            load_memory_database(connection, template)
+        else:
+            connection.close()
+            set_database_name(connection, name)
+
+def teardown_worker_databases(templates, clones, verbosity=1):
+    for databases in clones.values():
+        for connection, name, template in databases:
+            drop_test_database(connection, name, template)
+    for connection, old_name, old_test_name in templates:
+        connection.creation.destroy_test_db(old_name, verbosity)
+        set_test_database_name(connection, old_test_name)
+
+def schema_fingerprint(connection):
+    """
+    Returns a hash of the SQL syncdb would run to create every installed
+    model on the given connection. Only the models are consulted, never the
+    database, so the fingerprint can be taken before connecting.
+    """
+    from django.core.management.color import no_style
+    from django.db.models import get_apps, get_models
+
+    style = no_style()
+    creation = connection.creation
+    digest = md5_constructor(repr(list(settings.INSTALLED_APPS)))
+    for app in get_apps():
+        for model in get_models(app):
+            statements, pending = creation.sql_create_model(model, style, set())
+            statements += creation.sql_indexes_for_model(model, style)
+            statements += [field.m2m_db_table() for field in
+                model._meta.local_many_to_many]
+            digest.update(smart_str('\n'.join(statements)))
+    return digest.hexdigest()
+
+def load_fingerprints(path=FINGERPRINTS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        return json.load(open(path))
+    except ValueError:
+        return {}
+
+def save_fingerprints(fingerprints, path=FINGERPRINTS_FILE):
+    save_json(fingerprints, path, indent=1, sort_keys=True)
+
+def _flush_database(connection):
+    """
+    Empties a reused test database. TransactionTestCase flushes before each
+    test rather than after, and doctests commit, so the last run's rows
+    would otherwise be there for this run's TestCases.
+    """
+    if _multi_db():
+        call_command('flush', verbosity=0, interactive=False,
+            database=connection.alias)
+    else:
+        call_command('flush', verbosity=0, interactive=False)
+
+def _use_existing_database(connection, test_name):
+    """
+    Points the connection at an existing, emptied, test database, returning
+    False and leaving the connection alone if it can't be opened.
+    """
+    if is_sqlite(connection) and not os.path.exists(test_name):
+        return False
+    old_name = get_database_name(connection)
+    connection.close()
+    set_database_name(connection, test_name)
+    try:
+        connection.cursor()
+    except Exception:
+        connection.close()
+        set_database_name(connection, old_name)
+        return False
+    _flush_database(connection)
+    _record_transaction_support(connection)
+    return True
+
+def _keepdb_create_test_db(connection, create_test_db, verbosity=1,
+        autoclobber=False):
+    test_name = get_test_database_name(connection)
+    if test_name == ':memory:':
+        return create_test_db(verbosity, autoclobber)
+
+    fingerprint = schema_fingerprint(connection)
+    fingerprints = load_fingerprints()
+    if fingerprints.get(test_name) == fingerprint and \
+            _use_existing_database(connection, test_name):
+        if verbosity >= 1:
+            print "Reusing test database '%s'..." % test_name
+        return test_name
+
+    if test_name in fingerprints:
+        # the database is one we kept, so it's safe to replace it
+        autoclobber = True
+        if verbosity >= 1:
+            print "Schema changed, rebuilding test database '%s'..." % test_name
+    name = create_test_db(verbosity, autoclobber)
+    fingerprints = load_fingerprints()
+    fingerprints[test_name] = fingerprint
+    save_fingerprints(fingerprints)
+    return name
+
+def _keepdb_destroy_test_db(connection, destroy_test_db, old_database_name,
+        verbosity=1):
+    test_name = get_database_name(connection)
+    if test_name not in load_fingerprints():
+        return destroy_test_db(old_database_name, verbosity)
+    if verbosity >= 1:
+        print "Keeping test database '%s'..." % test_name
+    connection.close()
+    set_database_name(connection, old_database_name)
+
+def keep_databases():
+    """
+    Patches the creation object of every connection so create_test_db
+    reuses an existing test database whose schema fingerprint matches the
+    installed models, and destroy_test_db leaves it in place for the next
+    run. As every runner goes through these two methods this works for
+    all of them. In memory SQLite databases are still created every time.
+    """
+    for connection in get_connections():
+        creation = connection.creation
+        if getattr(creation, '_keepdb', False):
+            continue
+        creation._keepdb = True
+        creation.create_test_db = curry(_keepdb_create_test_db, connection,
+            creation.create_test_db)
+        creation.destroy_test_db = curry(_keepdb_destroy_test_db, connection,
+            creation.destroy_test_db)
+
+def _held_create_test_db(connection, create_test_db, verbosity=1,
+        autoclobber=False):
+    held = connection.creation._held
+    if 'name' in held:
+        if held['name'] != ':memory:':
+            connection.close()
+        set_database_name(connection, held['name'])
+        return held['name']
+    name = create_test_db(verbosity, autoclobber)
+    held['name'] = get_database_name(connection)
+    return name
+
+def _held_destroy_test_db(connection, destroy_test_db, old_database_name,
+        verbosity=1):
+    held = connection.creation._held
+    held['destroy'] = curry(destroy_test_db, old_database_name, verbosity)
+    # an open connection would go on using the test database under the old
+    # name, but closing an in memory database loses it
+    if held['name'] != ':memory:':
+        connection.close()
+    set_database_name(connection, old_database_name)
+
+def hold_databases():
+    """
+    Patches the creation object of every connection so the test database
+    is only created by the first create_test_db call and outlives
+    destroy_test_db, for running the suite repeatedly in one process. Call
+    release_databases to destroy them.
+    """
+    for connection in get_connections():
+        creation = connection.creation
+        if getattr(creation, '_held', None) is not None:
+            continue
+        creation._held = {}
+        creation.create_test_db = curry(_held_create_test_db, connection,
+            creation.create_test_db)
+        creation.destroy_test_db = curry(_held_destroy_test_db, connection,
+            creation.destroy_test_db)
+
+def release_databases():
+    "Destroys the test databases kept by hold_databases"
+    for connection in get_connections():
+        held = getattr(connection.creation, '_held', None) or {}
+        destroy = held.pop('destroy', None)
+        if destroy is not None:
+            set_database_name(connection, held.pop('name'))
+            destroy()
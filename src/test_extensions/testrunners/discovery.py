@@ -0,0 +1,192 @@
+"""
+A persistent index of the tests in each installed app, so test labels can
+be checked and listed without importing every test module.
+
+The index is kept in temp/testindex.json. An app's entry is rebuilt when
+one of its models or tests modules, or a module defining one of its test
+classes, changes. Files are compared by modification time, and by their
+contents when only the time has changed.
+"""
+
+import inspect
+import os
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import get_app
+from django.test.simple import build_suite, TEST_MODULE
+from django.utils.hashcompat import md5_constructor
+
+from test_extensions.jsonfile import save_json
+
+INDEX_FILE = os.path.join('temp', 'testindex.json')
+
+def flatten_suite(suite):
+    "Returns the individual tests of a (possibly nested) suite in order"
+    tests = getattr(suite, '_tests', None)
+    if tests is None:
+        return [suite]
+    flat = []
+    for test in tests:
+        flat.extend(flatten_suite(test))
+    return flat
+
+def _source_file(filename):
+    filename = os.path.abspath(filename)
+    if filename.endswith('.pyc') or filename.endswith('.pyo'):
+        filename = filename[:-1]
+    return filename
+
+def _module_files(path):
+    "Returns the source files of the module or package at path, less .py"
+    if os.path.isdir(path):
+        files = []
+        for directory, dirnames, filenames in os.walk(path):
+            files.extend([os.path.join(directory, filename)
+                for filename in filenames if filename.endswith('.py')])
+        return files
+    if os.path.exists(path + '.py'):
+        return [path + '.py']
+    return []
+
+def _app_files(app):
+    "Returns the source files of an app's models and tests modules"
+    models = os.path.splitext(_source_file(app.__file__))[0]
+    if os.path.basename(models) == '__init__':
+        models = os.path.dirname(models)
+    tests = os.path.join(os.path.dirname(models), TEST_MODULE)
+    return _module_files(models) + _module_files(tests)
+
+def _stamp(filename, previous=None):
+    "Returns [mtime, md5] for the file, only reading it if the mtime changed"
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return None
+    if previous is not None and previous[0] == mtime:
+        return previous
+    data = open(filename, 'rb').read()
+    return [mtime, md5_constructor(data).hexdigest()]
+
+def _doctest_label(test, app_label, modules):
+    """
+    Returns the label django.test.simple.build_test accepts for a doctest,
+    which is the app label followed by the name of the documented object.
+    """
+    name = test._dt_test.name
+    for module in modules:
+        if name == module:
+            return app_label
+        if name.startswith(module + '.'):
+            name = name[len(module) + 1:]
+            if name.startswith('__test__.'):
+                name = name[len('__test__.'):]
+            return '%s.%s' % (app_label, name)
+    return app_label
+
+def load_index(path=INDEX_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        return json.load(open(path))
+    except ValueError:
+        return {}
+
+class DiscoveryIndex(object):
+    """
+    Maps each app, by the name of its models module, to the labels of its
+    tests and the stamps of the files they were found in.
+    """
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.entries = load_index(path)
+        self.changed = False
+        self.root = os.path.abspath(os.getcwd())
+
+    def _fresh(self, entry, app):
+        files = set(entry['files'].keys() + _app_files(app))
+        for filename in files:
+            previous = entry['files'].get(filename)
+            stamp = _stamp(filename, previous)
+            if stamp is None or previous is None or stamp[1] != previous[1]:
+                return False
+            if stamp is not previous:
+                # only touched, keep the new time to skip hashing next time
+                entry['files'][filename] = stamp
+                self.changed = True
+        return True
+
+    def _build(self, app):
+        app_label = app.__name__.split('.')[-2]
+        package = app.__name__.rsplit('.', 1)[0]
+        modules = (app.__name__, '%s.%s' % (package, TEST_MODULE))
+        files = set(_app_files(app))
+        tests, doctests = [], []
+        seen = set()
+        for test in flatten_suite(build_suite(app)):
+            if hasattr(test, '_dt_test'):
+                label = _doctest_label(test, app_label, modules)
+                labels = doctests
+            else:
+                label = '%s.%s.%s' % (app_label, test.__class__.__name__,
+                    test.id().split('.')[-1])
+                labels = tests
+                try:
+                    source = inspect.getsourcefile(test.__class__)
+                except TypeError:
+                    source = None
+                if source and _source_file(source).startswith(self.root + os.sep):
+                    files.add(_source_file(source))
+            if label not in seen:
+                seen.add(label)
+                labels.append(label)
+        stamps = {}
+        for filename in files:
+            stamp = _stamp(filename)
+            if stamp is not None:
+                stamps[filename] = stamp
+        return {'files': stamps, 'tests': tests, 'doctests': doctests}
+
+    def entry(self, app):
+        "Returns the index entry of the app, rebuilding it if it's stale"
+        entry = self.entries.get(app.__name__)
+        if entry is None or not self._fresh(entry, app):
+            entry = self._build(app)
+            self.entries[app.__name__] = entry
+            self.changed = True
+        return entry
+
+    def labels(self, app):
+        "Returns the labels of every test and doctest in the app"
+        entry = self.entry(app)
+        return entry['tests'] + entry['doctests']
+
+    def has_tests(self, app):
+        return bool(self.labels(app))
+
+    def unknown_labels(self, test_labels):
+        "Returns the labels which don't name an installed app or its tests"
+        unknown = []
+        for label in test_labels:
+            parts = label.split('.')
+            try:
+                app = get_app(parts[0])
+            except ImproperlyConfigured:
+                unknown.append(label)
+                continue
+            if len(parts) == 1:
+                continue
+            if not [known for known in self.labels(app)
+                    if known == label or known.startswith(label + '.')]:
+                unknown.append(label)
+        return unknown
+
+    def save(self):
+        if not self.changed:
+            return
+        save_json(self.entries, self.path, indent=1, sort_keys=True)
+        self.changed = False
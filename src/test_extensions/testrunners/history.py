@@ -0,0 +1,192 @@
+"""
+Keeps the duration and outcome of every test from every run in a SQLite
+database, temp/history.sqlite3, along with the git commit the run was
+made from, and reports the slowest tests against their recent history.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import sqlite3
+except ImportError:  # We are in a version prior to Python 2.5
+    sqlite3 = None
+
+import listeners
+
+HISTORY_FILE = os.path.join('temp', 'history.sqlite3')
+
+# how many earlier runs of a test the rolling median is taken over
+WINDOW = 10
+
+# a test is flagged when it takes this many times its median, and at least
+# this many seconds longer, so jitter in very fast tests isn't flagged
+SLOWDOWN_RATIO = 1.5
+SLOWDOWN_SECONDS = 0.1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL,
+    revision TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER,
+    test TEXT,
+    duration REAL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, run_id);
+"""
+
+def current_revision():
+    "Returns the commit checked out in the current directory, if any"
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:  # no git
+        return None
+    output, errors = process.communicate()
+    if process.returncode:
+        return None
+    return output.strip()
+
+def connect(path=HISTORY_FILE):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    database = sqlite3.connect(path)
+    database.executescript(SCHEMA)
+    return database
+
+def _outcomes(result):
+    return (len(result.errors), len(result.failures),
+        len(getattr(result, 'skipped', ())))
+
+class HistoryRecorder(object):
+    """
+    Listens to the tests to time each one and note how it ended. Tests run
+    by a parallel worker carry the time the worker measured as _elapsed.
+    """
+    def __init__(self):
+        self.results = []
+        self.started = time.time()
+        self._start = {}
+
+    def start(self):
+        listeners.add(self)
+
+    def stop(self):
+        listeners.remove(self)
+
+    def start_test(self, result, test):
+        self._start[id(test)] = (time.time(), _outcomes(result))
+
+    def stop_test(self, result, test):
+        started, before = self._start.pop(id(test), (None, None))
+        if started is None:
+            return
+        duration = getattr(test, '_elapsed', None)
+        if duration is None:
+            duration = time.time() - started
+        errors, failures, skipped = [after - earlier for after, earlier
+            in zip(_outcomes(result), before)]
+        if errors:
+            outcome = 'error'
+        elif failures:
+            outcome = 'failure'
+        elif skipped:
+            outcome = 'skip'
+        else:
+            outcome = 'success'
+        self.results.append((test.id(), duration, outcome))
+
+    def save(self, path=HISTORY_FILE):
+        "Stores the run, returning its id, or None if it wasn't stored"
+        if sqlite3 is None or not self.results:
+            return None
+        try:
+            database = connect(path)
+        except (sqlite3.Error, OSError), e:
+            # the history is a nicety, it mustn't fail the run
+            print >>sys.stderr, "Couldn't record the run in %s: %s" % (path, e)
+            return None
+        try:
+            cursor = database.execute(
+                'INSERT INTO runs (started, revision) VALUES (?, ?)',
+                (self.started, current_revision()))
+            run_id = cursor.lastrowid
+            database.executemany('INSERT INTO results '
+                '(run_id, test, duration, outcome) VALUES (?, ?, ?, ?)',
+                [(run_id, test, duration, outcome)
+                    for test, duration, outcome in self.results])
+            database.commit()
+        finally:
+            database.close()
+        return run_id
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def slowdown(duration, median):
+    "Tells whether a test suddenly got slower"
+    return median is not None and duration > median * SLOWDOWN_RATIO and \
+        duration - median > SLOWDOWN_SECONDS
+
+def trends(run_id, path=HISTORY_FILE, window=WINDOW):
+    """
+    Returns (test, duration, median, flagged) for every successful test of
+    the given run, slowest first. The median is of the test's durations in
+    its previous window successful runs, or None if it has no history.
+    """
+    database = connect(path)
+    try:
+        rows = database.execute('SELECT test, duration FROM results '
+            'WHERE run_id = ? AND outcome = ? ORDER BY duration DESC',
+            (run_id, 'success')).fetchall()
+        trends = []
+        for test, duration in rows:
+            previous = [row[0] for row in database.execute(
+                'SELECT duration FROM results WHERE test = ? AND run_id < ? '
+                'AND outcome = ? ORDER BY run_id DESC LIMIT ?',
+                (test, run_id, 'success', window))]
+            median = previous and _median(previous) or None
+            trends.append((test, duration, median, slowdown(duration, median)))
+        return trends
+    finally:
+        database.close()
+
+def print_slowest(run_id, count, stream=sys.stderr, path=HISTORY_FILE):
+    """
+    Prints the count slowest tests of the run with their change from the
+    rolling median, then any other tests which suddenly got slower.
+    """
+    rows = trends(run_id, path)
+    if not rows:
+        return
+    print >>stream
+    print >>stream, "Slowest %d tests, against the median of their last %d runs:" % (
+        min(count, len(rows)), WINDOW)
+    for row in rows[:count]:
+        print >>stream, _format_trend(*row)
+    others = [row for row in rows[count:] if row[3]]
+    if others:
+        print >>stream, "Also slower than usual:"
+        for row in others:
+            print >>stream, _format_trend(*row)
+
+def _format_trend(test, duration, median, flagged):
+    if median is None:
+        change = 'new'
+    else:
+        change = '%+.3fs' % (duration - median)
+        if median:
+            change += ' (%+.0f%%)' % ((duration - median) * 100 / median)
+    return '%8.3fs  %-22s %s%s' % (duration, change, test,
+        flagged and '  SLOWER' or '')
@@ -0,0 +1,216 @@
+"""
+Streams the results of a run as JSON lines, for test --jsonl, and turns
+the stream into a JUnit xml report.
+
+Each line is a JSON object with an "event": "run" when the run starts,
+"start" and "stop" for each test and "end" when the run is over. The stop
+line carries the test's outcome, duration, tracebacks, extra assertions,
+queries, properties and what it wrote to stdout and stderr. Every line is
+flushed as it's written, so the file can be followed while the tests run
+and whatever a crashed run got through is still there; a test with a
+start but no stop is the one it crashed in. An error reported outside of a
+test, as TransactionTestCase does for loading fixtures and its teardown,
+gets a stop line with no start.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+import listeners
+from capture import OutputCapture, OUTPUT_LIMIT
+from junit import JUnitWriter, bound_traceback, report_path, \
+    test_properties, testcase_xml
+from test_extensions.queries import capture_queries
+
+def _outcomes(result):
+    return (len(result.errors), len(result.failures),
+        len(getattr(result, 'skipped', ())))
+
+def _exception_name(traceback):
+    "Returns the name of the exception a formatted traceback ends with"
+    lines = [line for line in traceback.splitlines() if line.strip()]
+    if not lines:
+        return 'Exception'
+    return lines[-1].split(':')[0].strip()
+
+class JsonLinesRecorder(object):
+    """
+    Listens to the tests to write a line for each as it starts and stops,
+    whichever runner the tests run under. Tests run by a parallel worker
+    carry the queries and output the worker saw as _remote.
+    """
+    def __init__(self, path=None, limit=OUTPUT_LIMIT):
+        self.path = path or report_path(None, 'jsonl')
+        self.limit = limit
+        self.tests = self.errors = self.failures = 0
+        self._start = {}
+        self.output = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.output = open(self.path, 'w')
+        # workers forked by --parallel inherit the hooks, but it's the
+        # parent which writes their tests
+        self.pid = os.getpid()
+        self.stdout = OutputCapture(sys.stdout, self.limit)
+        sys.stdout = self.stdout
+        self.stderr = OutputCapture(sys.stderr, self.limit)
+        sys.stderr = self.stderr
+        self.write(event='run', time=time.time(), pid=self.pid)
+        listeners.add(self)
+
+    def stop(self):
+        listeners.remove(self)
+        for capture, name in ((self.stdout, 'stdout'), (self.stderr, 'stderr')):
+            if getattr(sys, name) is capture:
+                setattr(sys, name, capture.stream)
+        self.write(event='end', time=time.time(), tests=self.tests,
+            errors=self.errors, failures=self.failures,
+            stdout=self.stdout.read(), stderr=self.stderr.read())
+        self.stdout.close()
+        self.stderr.close()
+        self.output.close()
+
+    def write(self, **line):
+        self.output.write(json.dumps(line) + '\n')
+        self.output.flush()
+
+    def start_test(self, result, test):
+        if os.getpid() != self.pid:
+            return
+        started = time.time()
+        self._start[id(test)] = (started, _outcomes(result),
+            capture_queries())
+        for capture in (self.stdout, self.stderr):
+            capture.start_test()
+        self.write(event='start', test=test.id(), time=started)
+
+    def stop_test(self, result, test):
+        if os.getpid() != self.pid:
+            return
+        started, before, queries = self._start.pop(id(test),
+            (None, None, None))
+        if started is None:
+            return
+        stopped = time.time()
+        queries.stop()
+        query_count, query_time = len(queries), queries.time()
+        stdout, stderr = [capture.stop_test()
+            for capture in (self.stdout, self.stderr)]
+        remote = getattr(test, '_remote', {})
+        if 'addQueries' in remote:
+            query_count, query_time = remote['addQueries']
+        if 'addOutput' in remote:
+            stdout, stderr = remote['addOutput']
+        duration = getattr(test, '_elapsed', None)
+        if duration is None:
+            duration = stopped - started
+
+        errors, failures, skipped = [after - earlier for after, earlier
+            in zip(_outcomes(result), before)]
+        tracebacks = []
+        for tag, added in (('error', result.errors[len(result.errors) - errors:]),
+                ('failure', result.failures[len(result.failures) - failures:])):
+            for failed, traceback in added:
+                tracebacks.append((tag, _exception_name(traceback),
+                    bound_traceback(traceback)))
+        if errors:
+            outcome = 'error'
+        elif failures:
+            outcome = 'failure'
+        elif skipped:
+            outcome = 'skip'
+        else:
+            outcome = 'success'
+        self.tests += 1
+        self.errors += errors and 1 or 0
+        self.failures += not errors and failures and 1 or 0
+
+        self.write(event='stop', test=test.id(),
+            classname=test.__class__.__name__,
+            name=test.id().split('.')[-1],
+            desc=(getattr(test, '_testMethodDoc', None) or '').strip(),
+            time=stopped, duration=duration, outcome=outcome,
+            failures=tracebacks,
+            assertions=getattr(test, '_extraAssertions', []),
+            queries=query_count, query_time=query_time,
+            properties=test_properties(test), stdout=stdout, stderr=stderr)
+
+    def add_problem(self, result, test, tag, traceback):
+        if os.getpid() != self.pid or id(test) in self._start:
+            return  # stop_test writes those of the test running
+        self.tests += 1
+        if tag == 'error':
+            self.errors += 1
+        else:
+            self.failures += 1
+        self.write(event='stop', test=test.id(),
+            classname=test.__class__.__name__,
+            name=test.id().split('.')[-1],
+            desc=(getattr(test, '_testMethodDoc', None) or '').strip(),
+            time=time.time(), duration=0.0, outcome=tag,
+            failures=[(tag, _exception_name(traceback),
+                bound_traceback(traceback))],
+            assertions=[], queries=0, query_time=0.0, properties=[],
+            stdout='', stderr='')
+
+def jsonl_to_junit(path, output, name=''):
+    """
+    Writes the JUnit report of the JSON lines at path to output, returning
+    the JUnitWriter. A test which started but never stopped is reported as
+    an error, and a line cut short by a crash is skipped.
+    """
+    report = JUnitWriter(output, name)
+    # the tests started and not yet stopped, in the order they started
+    started = {}
+    stdout = stderr = ''
+    stream = open(path)
+    try:
+        for line in stream:
+            try:
+                line = json.loads(line)
+            except ValueError:
+                continue
+            event = line.get('event')
+            if event == 'start':
+                started[line['test']] = line['time']
+            elif event == 'stop':
+                started.pop(line['test'], None)
+                properties = [('queries', '%d' % line['queries']),
+                    ('query_time', '%.3f' % line['query_time'])] + \
+                    [tuple(property) for property in line['properties']]
+                seen = {}
+                assertions = []
+                for assertion in line['assertions']:
+                    if not seen.has_key(assertion):
+                        assertions.append(assertion[:110])
+                        seen[assertion] = True
+                report.write(testcase_xml(line['classname'], line['name'],
+                    line['duration'], line['desc'], line['failures'],
+                    assertions, properties, line['stdout'], line['stderr'],
+                    report.fingerprints))
+                report.add(line['outcome'], line['duration'])
+            elif event == 'end':
+                stdout, stderr = line['stdout'], line['stderr']
+    except:
+        stream.close()
+        report.abort()
+        raise
+    stream.close()
+    for when, test in sorted([(when, test)
+            for test, when in started.items()]):
+        parts = test.split('.')
+        report.write(testcase_xml(len(parts) > 1 and parts[-2] or test,
+            parts[-1], 0.0, failures=[('error', 'Unfinished',
+                'The run stopped before this test finished')]))
+        report.add('error', 0.0)
+    report.close(stdout, stderr)
+    return report
@@ -0,0 +1,362 @@
+"""
+Writes JUnit style XML reports as the tests run, and merges them.
+
+Each <testcase> goes straight to the file as the result writes it, so the
+report never has to be held in memory. The totals belong in the opening
+<testsuite> tag but are only known at the end, so room is left for them
+there and the tag is rewritten in place when the report is closed.
+
+Reports are written under a name of their own to the process and only
+renamed into place once complete, so several processes can write them
+side by side. A run can write a report per app, and add a suffix to the
+report names, so shards or machines don't overwrite each other's.
+
+Tracebacks are cut down to a number of frames and a size. When many tests
+fail the same way, as they do when a shared fixture breaks, only the first
+carries the traceback; the others give their own exception and name the
+testcase which has it.
+"""
+
+import os
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from xml.etree.cElementTree import iterparse, tostring
+except ImportError:  # We are in a version prior to Python 2.5
+    from cElementTree import iterparse, tostring
+
+from django.utils.hashcompat import md5_constructor
+
+REPORT_DIR = os.path.join('temp', 'xml')
+
+# how many frames of a traceback are kept, the outermost quarter and the
+# innermost rest, and how many characters
+TRACEBACK_DEPTH = 20
+TRACEBACK_SIZE = 16 * 1024
+
+# characters XML 1.0 doesn't allow, even escaped
+_INVALID = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+# spare room in the opening tag for the totals
+HEADER_ROOM = 80
+
+_naming = {'per_app': False, 'suffix': None}
+
+def _clean(text):
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return _INVALID.sub(u'\ufffd', text)
+
+def xml_text(text):
+    "Escapes text for the content of an element"
+    return escape(_clean(text))
+
+def xml_attribute(text):
+    "Escapes and quotes text for an attribute value, keeping its newlines"
+    return quoteattr(_clean(text), {'\n': '&#10;', '\r': '&#13;', '\t': '&#9;'})
+
+def cdata(text):
+    "Wraps text in a CDATA section, splitting any ]]> in it"
+    return u'<![CDATA[%s]]>' % _clean(text).replace(u']]>', u']]]]><![CDATA[>')
+
+def name_reports(per_app=False, suffix=None):
+    """
+    Makes the xml runs in this process write a report for each app rather
+    than one for the run, and adds suffix to the names of the reports.
+    """
+    _naming['per_app'] = per_app
+    _naming['suffix'] = suffix
+
+def report_path(app=None, extension='xml'):
+    "Returns the path of the report for the app, or for the whole run"
+    suffix = ''
+    if _naming['suffix']:
+        suffix = '-' + _UNSAFE.sub('_', _naming['suffix'])
+    if app is None:
+        return os.path.join(REPORT_DIR, 'test_output%s.%s' % (suffix,
+            extension))
+    return os.path.join(REPORT_DIR, 'TEST-%s%s.%s' % (
+        _UNSAFE.sub('_', app), suffix, extension))
+
+def test_properties(test):
+    "Returns (name, value) for the figures other tools attached to a test"
+    properties = []
+    # set by test --profile
+    for rank, (function, tottime, cumtime, calls) in enumerate(
+            getattr(test, '_hotspots', [])):
+        properties.append(('hotspot.%d' % (rank + 1),
+            '%s tottime=%.4f cumtime=%.4f calls=%d' % (function, tottime,
+                cumtime, calls)))
+    # set by BenchmarkCommon.benchmark
+    for key, statistics in getattr(test, '_benchmarks', []):
+        prefix = 'benchmark' + key[len(test.id()):]
+        for name in ('rounds', 'min', 'median', 'p95', 'mean', 'max'):
+            if name == 'rounds':
+                value = '%d' % statistics[name]
+            else:
+                value = '%.6f' % statistics[name]
+            properties.append(('%s.%s' % (prefix, name), value))
+    # set by test --memory
+    if hasattr(test, '_memory'):
+        properties.append(('memory_kept', '%d' % test._memory[0]))
+        properties.append(('objects_kept', '%d' % test._memory[1]))
+    return properties
+
+def _split_traceback(traceback):
+    "Splits a formatted traceback into the lines before its frames, the frames and the exception"
+    header, frames, exception = [], [], []
+    for line in traceback.splitlines(True):
+        if exception:
+            exception.append(line)
+        elif line.startswith('  File '):
+            frames.append([line])
+        elif frames and line.startswith('    '):
+            frames[-1].append(line)  # the source of the frame
+        elif frames:
+            exception.append(line)
+        else:
+            header.append(line)
+    return header, frames, exception
+
+def bound_traceback(traceback, depth=TRACEBACK_DEPTH, size=TRACEBACK_SIZE):
+    """
+    Cuts the middle out of a formatted traceback with more than depth
+    frames, or longer than size characters, saying how much was left out.
+    """
+    header, frames, exception = _split_traceback(traceback)
+    if len(frames) > depth:
+        outer = depth // 4
+        frames = frames[:outer] + [['  [%d frames left out]\n' % (
+            len(frames) - depth)]] + frames[outer - depth:]
+        traceback = ''.join(header + sum(frames, []) + exception)
+    if len(traceback) > size:
+        half = size // 2
+        traceback = '%s\n[%d characters left out]\n%s' % (traceback[:half],
+            len(traceback) - 2 * half, traceback[-half:])
+    return traceback
+
+def fingerprint(kind, traceback):
+    """
+    Returns a digest of the exception type and the places in the code the
+    traceback went through, the same for failures which only differ in
+    their messages.
+    """
+    header, frames, exception = _split_traceback(traceback)
+    stack = '\n'.join([kind] + [frame[0].strip() for frame in frames])
+    if isinstance(stack, unicode):
+        stack = stack.encode('utf-8')
+    return md5_constructor(stack).hexdigest()[:12]
+
+def failure_xml(tag, kind, traceback, test, seen=None):
+    """
+    Returns an <error> or <failure> element for the traceback. seen maps
+    the fingerprints of the tracebacks already in the report to the test
+    which has them; a traceback in it gets the exception alone and names
+    that test, others are added to it.
+    """
+    # bounded first, so a traceback bounded before has the same fingerprint
+    traceback = bound_traceback(traceback)
+    key = fingerprint(kind, traceback)
+    if seen is not None and key in seen:
+        exception = _split_traceback(traceback)[2] or [traceback]
+        return u'<%s type=%s fingerprint="%s" duplicate_of=%s>%s</%s>' % (tag,
+            xml_attribute(kind), key, xml_attribute(seen[key]),
+            xml_text(''.join(exception)), tag)
+    if seen is not None:
+        seen[key] = test
+    return u'<%s type=%s fingerprint="%s">%s</%s>' % (tag,
+        xml_attribute(kind), key, xml_text(traceback), tag)
+
+def testcase_xml(classname, name, seconds, desc=None, failures=(),
+        assertions=(), properties=(), stdout='', stderr='', seen=None):
+    """
+    Returns a <testcase> element. failures are (tag, type, traceback) with
+    tag error or failure, properties (name, value). seen is for
+    failure_xml.
+    """
+    xml = [u'<testcase classname=%s name=%s' % (xml_attribute(classname),
+        xml_attribute(name))]
+    if desc:
+        xml.append(u' desc=%s' % xml_attribute(desc))
+    xml.append(u' time="%.3f">' % seconds)
+    for tag, kind, traceback in failures:
+        xml.append(failure_xml(tag, kind, traceback,
+            '%s.%s' % (classname, name), seen))
+    for assertion in assertions:
+        xml.append(u'<assert>%s</assert>' % xml_text(assertion))
+    if properties:
+        xml.append(u'<properties>')
+        for property, value in properties:
+            xml.append(u'<property name=%s value=%s/>' % (
+                xml_attribute(property), xml_attribute(value)))
+        xml.append(u'</properties>')
+    if stdout:
+        xml.append(u'<system-out>%s</system-out>' % cdata(stdout))
+    if stderr:
+        xml.append(u'<system-err>%s</system-err>' % cdata(stderr))
+    xml.append(u'</testcase>')
+    return u''.join(xml)
+
+class JUnitWriter(object):
+    """
+    A report written through write(), with the totals kept by add() and
+    filled in, with the output of the run, by close().
+    """
+    def __init__(self, path, name='', tag='testsuite'):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.name = name
+        self.tag = tag
+        self.tests = self.errors = self.failures = 0
+        self.seconds = 0.0
+        # the fingerprints of the tracebacks written, for testcase_xml
+        self.fingerprints = {}
+        self._partial = '%s.%d.part' % (path, os.getpid())
+        self.output = open(self._partial, 'wb')
+        self.output.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self._header_at = self.output.tell()
+        self._header_size = len(self._header()) + HEADER_ROOM
+        self.output.write(' ' * self._header_size + '\n')
+
+    def _header(self):
+        return ('<%s errors="%d" failures="%d" name=%s tests="%d" time="%.3f"' % (
+            self.tag, self.errors, self.failures, xml_attribute(self.name),
+            self.tests, self.seconds)).encode('utf-8')
+
+    def add(self, outcome, seconds):
+        "Counts a test which ended in success, error or failure"
+        self.tests += 1
+        self.seconds += seconds
+        if outcome == 'error':
+            self.errors += 1
+        elif outcome == 'failure':
+            self.failures += 1
+
+    def write(self, xml):
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        self.output.write(xml)
+
+    def flush(self):
+        self.output.flush()
+
+    def close(self, stdout='', stderr='', params=''):
+        "Adds the output of the run and finishes the report"
+        self.write(u'<system-out>%s%s</system-out>' % (params, cdata(stdout)))
+        self.write(u'<system-err>%s</system-err>' % cdata(stderr))
+        self.finish()
+
+    def abort(self):
+        "Closes the report and throws it away"
+        self.output.close()
+        os.remove(self._partial)
+
+    def finish(self):
+        "Closes the report, fills in the totals and moves it into place"
+        self.write('</%s>\n' % self.tag)
+        self.output.seek(self._header_at)
+        # attributes may be followed by any amount of whitespace
+        self.output.write(self._header().ljust(self._header_size) + '>')
+        self.output.close()
+        if os.path.exists(self.path) and os.name == 'nt':
+            os.remove(self.path)  # rename doesn't replace files on Windows
+        os.rename(self._partial, self.path)
+
+class JUnitReports(object):
+    """
+    The reports of one run, either the one for the whole run or, after
+    name_reports(per_app=True), one for each app, given by app_of(test).
+    """
+    def __init__(self, app_of):
+        self.app_of = app_of
+        self.per_app = _naming['per_app']
+        self.writers = {}
+        self.order = []
+
+    def writer_for(self, test):
+        "Returns the report the test goes in, starting it if need be"
+        app = None
+        if self.per_app:
+            app = self.app_of(test)
+        if app not in self.writers:
+            self.writers[app] = JUnitWriter(report_path(app), app or '')
+            self.order.append(app)
+        return self.writers[app]
+
+    def close(self, stdout='', stderr='', params=''):
+        """
+        Finishes every report, returning their paths. The output from
+        outside the tests goes in the last one.
+        """
+        if not self.order and not self.per_app:
+            # an empty report rather than a stale one
+            self.writers[None] = JUnitWriter(report_path(None))
+            self.order.append(None)
+        paths = []
+        for app in self.order:
+            writer = self.writers[app]
+            if app == self.order[-1]:
+                writer.close(stdout, stderr, params)
+            else:
+                writer.close()
+            paths.append(writer.path)
+        self.writers = {}
+        self.order = []
+        return paths
+
+def _start_tag(element):
+    attributes = ''.join([' %s=%s' % (name, xml_attribute(value))
+        for name, value in element.attrib.items()])
+    return '<%s%s>' % (element.tag, attributes)
+
+def _number(value, kind=int):
+    try:
+        return kind(value or 0)
+    except ValueError:
+        return kind(0)
+
+def merge_reports(paths, path, name=''):
+    """
+    Combines the testsuites of the JUnit reports at paths, which may be
+    <testsuites> themselves, into one <testsuites> report at path. The
+    reports are read a testcase at a time, so any number of them, of any
+    size, are merged in constant memory. Returns the merged report.
+    """
+    merged = JUnitWriter(path, name, tag='testsuites')
+    try:
+        for report in paths:
+            _copy_suites(report, merged)
+    except:
+        merged.abort()
+        raise
+    merged.finish()
+    return merged
+
+def _copy_suites(report, merged):
+    "Writes the testsuites of a report into the merged one"
+    depth = 0
+    suite = None
+    for event, element in iterparse(report, ('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if suite is None and element.tag == 'testsuite':
+                suite, suite_depth = element, depth
+                merged.write(_start_tag(element))
+                merged.tests += _number(element.get('tests'))
+                merged.errors += _number(element.get('errors'))
+                merged.failures += _number(element.get('failures'))
+                merged.seconds += _number(element.get('time'), float)
+            continue
+        if element is suite:
+            merged.write('</testsuite>')
+            suite = None
+            element.clear()
+        elif suite is not None and depth == suite_depth + 1:
+            merged.write(tostring(element))
+            # done with it, and the testcases before it
+            suite.clear()
+        depth -= 1
@@ -0,0 +1,64 @@
+"""
+The one hook on TestResult.startTest, stopTest, addError and addFailure
+shared by everything which follows the tests as they run, whichever runner runs them: the
+history, --profile, --memory, --jsonl, --live and the test map.
+
+A listener has start_test(result, test) and stop_test(result, test)
+methods. start_test is called after TestResult.startTest and stop_test
+before TestResult.stopTest, as every result class calls them from its own.
+Listeners hear of a test starting in the order they were added and of it
+stopping in the reverse order, so one added first measures around those
+added later and sees whatever they gave the test. They can be removed in
+any order; the hook comes off with the last of them.
+
+A listener may also have add_problem(result, test, tag, traceback), called
+after TestResult.addError and addFailure with tag error or failure and the
+formatted traceback. It's the only way to hear of the errors which
+TransactionTestCase reports outside of startTest and stopTest, from loading
+fixtures and its teardown.
+"""
+
+import unittest
+
+_listeners = []
+_originals = {}
+
+def add(listener):
+    "Starts telling the listener about every test"
+    if not _listeners:
+        for name, hook in _hooks.items():
+            _originals[name] = unittest.TestResult.__dict__[name]
+            setattr(unittest.TestResult, name, hook)
+    _listeners.append(listener)
+
+def remove(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+    if not _listeners and _originals:
+        for name in _hooks:
+            setattr(unittest.TestResult, name, _originals.pop(name))
+
+def _startTest(result, test):
+    value = _originals['startTest'](result, test)
+    for listener in _listeners[:]:
+        listener.start_test(result, test)
+    return value
+
+def _stopTest(result, test):
+    for listener in _listeners[::-1]:
+        listener.stop_test(result, test)
+    return _originals['stopTest'](result, test)
+
+def _problem(name, tag, problems):
+    def hook(result, test, err):
+        value = _originals[name](result, test, err)
+        for listener in _listeners[:]:
+            if hasattr(listener, 'add_problem'):
+                listener.add_problem(result, test, tag,
+                    getattr(result, problems)[-1][1])
+        return value
+    return hook
+
+_hooks = {'startTest': _startTest, 'stopTest': _stopTest,
+    'addError': _problem('addError', 'error', 'errors'),
+    'addFailure': _problem('addFailure', 'failure', 'failures')}
@@ -0,0 +1,377 @@
+"""
+Publishes the start and stop of each test, as it happens, over a Unix
+domain socket, for test --live and the watchtests command.
+
+The run listens on the socket, temp/live.sock by default, and sends every
+client a JSON line for each event: "hello" with the state of the run when
+the client connects, then "expect" with the number of tests once it's
+known, "start" and "stop" for each test and "end". Anything a client sends
+is published too, which is how the workers of --parallel, forked with the
+listener in place, report the tests they run. A client which can't keep up
+is dropped rather than hold up the tests.
+
+The functions below do nothing unless a run is being published.
+"""
+
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import unittest
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+import listeners
+
+SOCKET_FILE = os.path.join('temp', 'live.sock')
+
+_publisher = None
+
+def expect(count):
+    "Tells the clients how many tests the run has, unless they know already"
+    if _publisher is not None and _publisher.total is None:
+        _publisher.publish({'event': 'expect', 'total': count})
+
+def _outcomes(result):
+    return (len(result.errors), len(result.failures),
+        len(getattr(result, 'skipped', ())))
+
+class LivePublisher(object):
+    """
+    Listens to the tests, and hooks TestSuite to count them, and publishes
+    what they do to the clients of the socket at path.
+    """
+    def __init__(self, path=SOCKET_FILE):
+        self.path = path
+        self.total = None
+        self.done = self.errors = self.failures = 0
+        self.started = time.time()
+        self.running = {}
+        self.clients = []
+        # every connection, with what it sent since its last full line
+        self.workers = {}
+        self.lock = threading.Lock()
+        self._start = {}
+        self._stopping = False
+        self._connection = None
+
+    def start(self):
+        "Starts listening, returning False if the socket couldn't be made"
+        global _publisher
+        if not hasattr(socket, 'AF_UNIX'):
+            print >>sys.stderr, "Unix domain sockets aren't available here; not publishing the run"
+            return False
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # left by a run which died
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.server.bind(self.path)
+            self.server.listen(5)
+        except socket.error, e:
+            print >>sys.stderr, "Couldn't listen on %s: %s; not publishing the run" % (
+                self.path, e)
+            self.server.close()
+            return False
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        _publisher = self
+
+        publisher = self
+        self._run = unittest.TestSuite.__dict__['run']
+
+        def run(suite, result, *args, **kwargs):
+            # the outermost suite has every test
+            if os.getpid() == publisher.pid:
+                expect(suite.countTestCases())
+            return publisher._run(suite, result, *args, **kwargs)
+
+        unittest.TestSuite.run = run
+        listeners.add(self)
+        return True
+
+    def stop(self):
+        global _publisher
+        listeners.remove(self)
+        unittest.TestSuite.run = self._run
+        _publisher = None
+        self.publish({'event': 'end', 'time': time.time()})
+        self._stopping = True
+        self.thread.join()
+        self.lock.acquire()
+        try:
+            for client in self.clients + self.workers.keys():
+                client.close()
+            self.clients = []
+            self.workers = {}
+        finally:
+            self.lock.release()
+        self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _state(self):
+        return {'event': 'hello', 'started': self.started,
+            'total': self.total, 'done': self.done, 'errors': self.errors,
+            'failures': self.failures, 'running': [[test, started, pid]
+                for test, (started, pid) in self.running.items()]}
+
+    def _apply(self, event):
+        kind = event.get('event')
+        if kind == 'expect':
+            self.total = event['total']
+        elif kind == 'start':
+            self.running[event['test']] = (event['time'], event['pid'])
+        elif kind == 'stop':
+            self.running.pop(event['test'], None)
+            self.done += 1
+            if event['outcome'] == 'error':
+                self.errors += 1
+            elif event['outcome'] == 'failure':
+                self.failures += 1
+
+    def publish(self, event):
+        "Sends the event to every client, dropping the ones which are stuck"
+        line = json.dumps(event) + '\n'
+        self.lock.acquire()
+        try:
+            self._apply(event)
+            for client in self.clients[:]:
+                try:
+                    client.sendall(line)
+                except socket.error:
+                    self.clients.remove(client)
+                    self.workers.pop(client, None)
+                    client.close()
+        finally:
+            self.lock.release()
+
+    def _serve(self):
+        "Takes new clients and the events of workers, until stop()"
+        while not self._stopping:
+            readers = [self.server] + self.workers.keys()
+            try:
+                ready = select.select(readers, [], [], 0.2)[0]
+            except (select.error, socket.error):
+                continue  # a worker went away as stop() closed it
+            for reader in ready:
+                if reader is self.server:
+                    self._accept()
+                else:
+                    self._receive(reader)
+
+    def _accept(self):
+        client = self.server.accept()[0]
+        self.lock.acquire()
+        try:
+            try:
+                client.sendall(json.dumps(self._state()) + '\n')
+                # from here on it mustn't hold up the run
+                client.setblocking(0)
+                self.clients.append(client)
+                self.workers[client] = ''
+            except socket.error:
+                client.close()
+        finally:
+            self.lock.release()
+
+    def _receive(self, client):
+        try:
+            data = client.recv(65536)
+        except socket.error:
+            data = ''
+        self.lock.acquire()
+        try:
+            if client in self.clients:
+                # only workers send anything, and they don't listen
+                self.clients.remove(client)
+            if client not in self.workers:
+                return  # dropped meanwhile
+            if not data:
+                del self.workers[client]
+                client.close()
+                return
+            lines = (self.workers[client] + data).split('\n')
+            self.workers[client] = lines.pop()
+        finally:
+            self.lock.release()
+        for line in lines:
+            try:
+                self.publish(json.loads(line))
+            except ValueError:
+                pass
+
+    def _send(self, event):
+        if os.getpid() == self.pid:
+            self.publish(event)
+            return
+        # a worker of --parallel, which reports to the run over a
+        # connection of its own
+        try:
+            if self._connection is None:
+                self._connection = socket.socket(socket.AF_UNIX,
+                    socket.SOCK_STREAM)
+                self._connection.connect(self.path)
+            self._connection.sendall(json.dumps(event) + '\n')
+        except socket.error:
+            pass
+
+    def start_test(self, result, test):
+        # tests replayed from a worker were published by the worker
+        if hasattr(test, '_remote'):
+            return
+        started = time.time()
+        self._start[id(test)] = (started, _outcomes(result))
+        self._send({'event': 'start', 'test': test.id(), 'time': started,
+            'pid': os.getpid()})
+
+    def stop_test(self, result, test):
+        started, before = self._start.pop(id(test), (None, None))
+        if started is None:
+            return
+        errors, failures, skipped = [after - earlier for after, earlier
+            in zip(_outcomes(result), before)]
+        if errors:
+            outcome = 'error'
+        elif failures:
+            outcome = 'failure'
+        elif skipped:
+            outcome = 'skip'
+        else:
+            outcome = 'success'
+        stopped = time.time()
+        self._send({'event': 'stop', 'test': test.id(), 'time': stopped,
+            'duration': stopped - started, 'outcome': outcome})
+
+def _clock(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+            seconds % 60)
+    return '%d:%02d' % (seconds // 60, seconds % 60)
+
+class _Progress(object):
+    "What a client knows of the run, from the events it was sent"
+    def __init__(self):
+        self.total = None
+        self.done = self.errors = self.failures = 0
+        self.started = time.time()
+        self.running = {}
+        self.ended = False
+
+    def apply(self, event):
+        kind = event.get('event')
+        if kind == 'hello':
+            self.started = event['started']
+            self.total = event['total']
+            self.done = event['done']
+            self.errors = event['errors']
+            self.failures = event['failures']
+            self.running = dict([(test, started)
+                for test, started, pid in event['running']])
+        elif kind == 'expect':
+            self.total = event['total']
+        elif kind == 'start':
+            self.running[event['test']] = event['time']
+        elif kind == 'stop':
+            self.running.pop(event['test'], None)
+            self.done += 1
+            if event['outcome'] == 'error':
+                self.errors += 1
+            elif event['outcome'] == 'failure':
+                self.failures += 1
+        elif kind == 'end':
+            self.ended = True
+
+    def status(self, now):
+        "Returns the progress, the ETA and the slowest test still running"
+        elapsed = now - self.started
+        if self.total:
+            progress = '%d/%d tests' % (self.done, self.total)
+        else:
+            progress = '%d tests' % self.done
+        status = '%s, %d errors, %d failures, %s' % (progress, self.errors,
+            self.failures, _clock(elapsed))
+        if self.total and self.done and not self.ended:
+            remaining = max(self.total - self.done, 0)
+            status += ', ETA %s' % _clock(elapsed / self.done * remaining)
+        if self.running:
+            started, test = min([(started, test)
+                for test, started in self.running.items()])
+            status += ' | running %s for %.1fs' % (test, now - started)
+        return status
+
+def watch(path=SOCKET_FILE, stream=sys.stdout, interval=1.0, wait=True):
+    """
+    Follows the run publishing on path, showing its progress, ETA and the
+    test which has been running longest, and each test which fails as it
+    does. Waits for a run to start if wait is set. Returns True if the run
+    was seen to the end.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    waiting = False
+    while True:
+        try:
+            connection.connect(path)
+            break
+        except socket.error:
+            if not wait:
+                raise
+            if not waiting:
+                print >>stream, "Waiting for a run to publish on %s" % path
+                waiting = True
+            time.sleep(interval)
+
+    progress = _Progress()
+    # rewrite the one status line on a terminal, print one a tick otherwise
+    tty = hasattr(stream, 'isatty') and stream.isatty()
+    width = 0
+    drawn = 0
+    pending = ''
+    while not progress.ended:
+        if select.select([connection], [], [], interval)[0]:
+            data = connection.recv(65536)
+            if not data:
+                break
+            lines = (pending + data).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                progress.apply(event)
+                if event.get('outcome') in ('error', 'failure'):
+                    if tty:
+                        stream.write('\r' + ' ' * width + '\r')
+                    print >>stream, '%s: %s (%.3fs)' % (
+                        event['outcome'] == 'error' and 'ERROR' or 'FAIL',
+                        event['test'], event['duration'])
+        now = time.time()
+        if progress.ended or now - drawn < (tty and 0.1 or interval):
+            continue
+        drawn = now
+        status = progress.status(now)
+        if tty:
+            stream.write('\r' + status.ljust(width))
+            width = len(status)
+        else:
+            stream.write(status + '\n')
+        stream.flush()
+    connection.close()
+    if tty:
+        stream.write('\n')
+    if progress.ended:
+        print >>stream, "Finished: %s" % progress.status(time.time())
+    else:
+        print >>stream, "The run went away before it finished"
+    return progress.ended
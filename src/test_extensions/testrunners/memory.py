@@ -0,0 +1,162 @@
+"""
+Memory held on to by each test, for test --memory.
+
+Between TestResult.startTest and stopTest, so around setUp, the test and
+tearDown, the garbage is collected and the process's memory and the
+number of objects the collector tracks are taken; the differences are
+what the test left behind. Django's TestCase loads its fixtures before
+startTest and rolls its transaction back after stopTest, so neither is
+counted, and what the rollback frees counts as kept. Memory comes
+from tracemalloc where it's available and from the resident set size
+otherwise, which the allocator seldom hands back, so small numbers are
+noise there. Each test gets its figures as test._memory, which the xml
+runner writes into its <testcase> element, and the totals of every
+TestCase class are saved to temp/memory.json.
+"""
+
+import gc
+import os
+import sys
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+try:
+    import tracemalloc
+except ImportError:  # only in Python 3.4 or with pytracemalloc
+    tracemalloc = None
+
+import listeners
+from phases import peak_rss
+from scheduling import class_key
+
+MEMORY_FILE = os.path.join('temp', 'memory.json')
+
+# tests keeping at least this much memory and some objects are reported as
+# never giving it back
+LEAK_BYTES = 1024 * 1024
+
+def _statm_rss():
+    "Returns the current resident set size in bytes, where /proc has it"
+    try:
+        statm = open('/proc/self/statm')
+    except IOError:
+        return None
+    try:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    finally:
+        statm.close()
+
+def memory_in_use():
+    """
+    Returns the bytes in use, and what they were measured with: tracemalloc,
+    the current RSS, or failing both the peak RSS.
+    """
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0], 'tracemalloc'
+    rss = _statm_rss()
+    if rss is not None:
+        return rss, 'rss'
+    peak = peak_rss()
+    if peak is not None:
+        return peak * 1024, 'peak rss'
+    return 0, None
+
+def _measure():
+    gc.collect()
+    return memory_in_use()[0], len(gc.get_objects())
+
+class MemoryRecorder(object):
+    """
+    Listens to the tests to measure the memory and objects each one leaves
+    behind.
+    """
+    def __init__(self, top=10):
+        self.top = top
+        self.tests = []
+        self.source = None
+        self._before = None
+        self._tracing = False
+
+    def start(self):
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self.source = memory_in_use()[1]
+        listeners.add(self)
+
+    def stop(self):
+        listeners.remove(self)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def start_test(self, result, test):
+        self._before = _measure()
+
+    def stop_test(self, result, test):
+        before, self._before = self._before, None
+        if before is None:
+            return
+        memory, objects = _measure()
+        test._memory = (memory - before[0], objects - before[1])
+        self.tests.append((test.id(), class_key(test)) + test._memory)
+
+    def classes(self):
+        "Returns (class, tests, bytes, objects) for each class, most bytes first"
+        totals = {}
+        for test_id, key, memory, objects in self.tests:
+            total = totals.setdefault(key, [key, 0, 0, 0])
+            total[1] += 1
+            total[2] += memory
+            total[3] += objects
+        classes = [tuple(total) for total in totals.values()]
+        classes.sort(key=lambda item: item[2], reverse=True)
+        return classes
+
+    def leaks(self):
+        "Returns the tests which kept memory and objects after their tearDown"
+        leaks = [test for test in self.tests
+            if test[2] >= LEAK_BYTES and test[3] > 0]
+        leaks.sort(key=lambda item: item[2], reverse=True)
+        return leaks
+
+    def report(self, stream=sys.stderr, path=MEMORY_FILE):
+        "Prints the worst tests and classes and writes every figure to a JSON file"
+        if not self.tests:
+            return
+        tests = sorted(self.tests, key=lambda item: item[2], reverse=True)
+        print >>stream
+        print >>stream, "Memory kept after tearDown, measured by %s:" % (
+            self.source or 'nothing')
+        print >>stream, "%12s %10s  %s" % ('KB', 'objects', 'test')
+        for test_id, key, memory, objects in tests[:self.top]:
+            print >>stream, "%12.1f %10d  %s" % (memory / 1024.0, objects,
+                test_id)
+        print >>stream, "%12s %10s  %s" % ('KB', 'objects', 'class (tests)')
+        for key, count, memory, objects in self.classes()[:self.top]:
+            print >>stream, "%12.1f %10d  %s (%d)" % (memory / 1024.0,
+                objects, key, count)
+        leaks = self.leaks()
+        if leaks:
+            print >>stream, "%d tests never gave back %dKB or more:" % (
+                len(leaks), LEAK_BYTES / 1024)
+            for test_id, key, memory, objects in leaks[:self.top]:
+                print >>stream, "    %s" % test_id
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        output = open(path, 'w')
+        json.dump({'source': self.source,
+            'tests': [{'test': test_id, 'class': key, 'bytes': memory,
+                'objects': objects}
+                for test_id, key, memory, objects in self.tests],
+            'classes': [{'class': key, 'tests': count, 'bytes': memory,
+                'objects': objects}
+                for key, count, memory, objects in self.classes()]},
+            output, indent=1)
+        output.close()
+        print >>stream, "Memory figures written to %s" % path
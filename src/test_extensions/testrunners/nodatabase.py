@@ -11,7 +11,7 @@ from django.test.utils import setup_test_environment, teardown_test_environment
 from django.conf import settings
 from django.test.simple import *
 
-import coverage
+import phases
 
 def run_tests(test_labels, verbosity=1, interactive=True, extra_tests=[]):
     """
@@ -97,7 +97,9 @@ def run_tests_with_coverage(test_labels, verbosity=1, interactive=True, extra_te
 
     modules_to_cover = []
 
-    # start doing some coverage action
+    # start doing some coverage action; coverage is imported here so the
+    # plain runner doesn't pay for it
+    import coverage
     cov = coverage.coverage()
     cov.erase()
     cov.start()
@@ -134,6 +136,7 @@ def run_tests_with_coverage(test_labels, verbosity=1, interactive=True, extra_te
 
     # stop coverage
     cov.stop()
+    phases.start('coverage reporting')
 
     # output results
     print ''
@@ -148,6 +151,7 @@ def run_tests_with_coverage(test_labels, verbosity=1, interactive=True, extra_te
         output_filename = 'temp/xml/coverage_output.xml'
         cov.xml_report(morfs=coverage_modules, outfile=output_filename)
     cov.report(modules_to_cover, show_missing=1)
+    phases.stop()
 
     return len(result.failures) + len(result.errors)
 
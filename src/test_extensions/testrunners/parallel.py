@@ -0,0 +1,486 @@
+"""
+Test runner which splits the suite into one chunk per TestCase class and
+runs the chunks in worker processes, each with its own test database.
+Results are streamed back to the parent process and merged into a single
+text or xml report.
+"""
+
+import select
+import sys
+import time
+import unittest
+
+from django.conf import settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.test.simple import build_suite, build_test
+from django.db.models import get_app, get_apps
+
+try:
+    import multiprocessing
+except ImportError:  # We are in a version prior to Python 2.6
+    multiprocessing = None
+
+from capture import OutputCapture
+import live
+from database import close_connections, get_connections, setup_databases, \
+    teardown_databases, setup_worker_databases, use_worker_databases, \
+    teardown_worker_databases
+from scheduling import DurationRecorder, assign_shards, chunk_key, \
+    estimate_durations, has_history, hash_shards, load_durations, \
+    longest_first, predict_makespan
+from test_extensions.queries import capture_queries
+
+def default_worker_count():
+    if multiprocessing is None:
+        return 1
+    return multiprocessing.cpu_count()
+
+def flatten_suite(suite):
+    "Returns the individual tests of a (possibly nested) suite in order"
+    tests = getattr(suite, '_tests', None)
+    if tests is None:
+        return [suite]
+    flat = []
+    for test in tests:
+        flat.extend(flatten_suite(test))
+    return flat
+
+def partition_suite(suite):
+    """
+    Splits a suite into one sub-suite per TestCase class, keeping the
+    classes in discovery order. Tests of a class always share a worker
+    so class level fixtures stay valid.
+    """
+    chunks = []
+    by_class = {}
+    for test in flatten_suite(suite):
+        key = test.__class__
+        if key not in by_class:
+            by_class[key] = unittest.TestSuite()
+            chunks.append(by_class[key])
+        by_class[key].addTest(test)
+    return chunks
+
+def build_test_suite(test_labels, extra_tests=[], nodatabase=False):
+    suite = unittest.TestSuite()
+
+    if test_labels:
+        for label in test_labels:
+            if '.' in label:
+                suite.addTest(build_test(label))
+            else:
+                app = get_app(label)
+                suite.addTest(build_suite(app))
+    else:
+        for app in get_apps():
+            # skip apps named "Django" because they use a database
+            if nodatabase and app.__name__.startswith('django'):
+                continue
+            suite.addTest(build_suite(app))
+
+    for test in extra_tests:
+        suite.addTest(test)
+
+    return suite
+
+class RemoteError(Exception):
+    """
+    Stands in for an exception raised in a worker process. The first
+    argument is the traceback as formatted by the worker.
+    """
+
+_remote_error_classes = {}
+
+def remote_exc_info(type_name, formatted):
+    """
+    Builds an exc_info style tuple from an error reported by a worker, with
+    an exception class carrying the original name so reports show it.
+    """
+    if type_name not in _remote_error_classes:
+        _remote_error_classes[type_name] = type(str(type_name), (RemoteError,), {})
+    error_class = _remote_error_classes[type_name]
+    return (error_class, error_class(formatted), None)
+
+class _RemoteTest(object):
+    "Placeholder for a test the parent process can't map back to its suite"
+    def __init__(self, test_id, description):
+        self._id = test_id
+        self._description = description
+        self._testMethodDoc = None
+
+    def id(self):
+        return self._id
+
+    def shortDescription(self):
+        return None
+
+    def __str__(self):
+        return self._description
+
+class _RemoteTestResult(unittest.TestResult):
+    """
+    Collects the outcome of each test run in a worker and sends it to the
+    parent process as soon as the test has stopped. Errors reported outside
+    of a test, as TransactionTestCase does for fixture loading and its
+    teardown, are sent straight away.
+    """
+    def __init__(self, channel, stop_event=None, failfast=False):
+        unittest.TestResult.__init__(self)
+        self.channel = channel
+        self.stop_event = stop_event
+        self.failfast = failfast
+        self.chunk = None
+        self._positions = {}
+        self._events = []
+        self._test = None
+        self._startTime = 0.0
+
+    def set_chunk(self, index, chunk):
+        self.chunk = index
+        self._positions = dict([(id(test), position)
+            for position, test in enumerate(chunk._tests)])
+
+    def startTest(self, test):
+        unittest.TestResult.startTest(self, test)
+        self._test = test
+        self._events = []
+        self._startTime = time.time()
+        self._queries = capture_queries()
+        # the xml runner captures the output, and workers inherit it
+        self._outputs = [stream for stream in (sys.stdout, sys.stderr)
+            if isinstance(stream, OutputCapture)]
+        for capture in self._outputs:
+            capture.start_test()
+
+    def stopTest(self, test):
+        elapsed = time.time() - self._startTime
+        queries = self._queries.stop()
+        self._events.append(('addQueries', (len(queries), queries.time())))
+        if len(self._outputs) == 2:
+            self._events.append(('addOutput', tuple([capture.stop_test()
+                for capture in self._outputs])))
+        unittest.TestResult.stopTest(self, test)
+        self._test = None
+        self.channel.send(('test', self.chunk, self._positions.get(id(test)),
+            test.id(), str(test), self._events, elapsed))
+        self._check_failfast()
+
+    def _check_failfast(self):
+        if self.failfast and self.stop_event is not None and \
+                (self.failures or self.errors):
+            self.stop_event.set()
+
+    def _err(self, test, err):
+        return (err[0].__name__, self._exc_info_to_string(err, test))
+
+    def _add_problem(self, test, name, err):
+        if test is self._test:
+            self._events.append((name, self._err(test, err)))
+            return
+        self.channel.send(('outside', self.chunk,
+            self._positions.get(id(test)), test.id(), str(test),
+            [(name, self._err(test, err))], 0.0))
+        self._check_failfast()
+
+    def addSuccess(self, test):
+        unittest.TestResult.addSuccess(self, test)
+        self._events.append(('addSuccess', ()))
+
+    def addError(self, test, err):
+        unittest.TestResult.addError(self, test, err)
+        self._add_problem(test, 'addError', err)
+
+    def addFailure(self, test, err):
+        unittest.TestResult.addFailure(self, test, err)
+        self._add_problem(test, 'addFailure', err)
+
+    def addSkip(self, test, reason):
+        unittest.TestResult.addSkip(self, test, reason)
+        self._events.append(('addSkip', (reason,)))
+
+    def addExpectedFailure(self, test, err):
+        unittest.TestResult.addExpectedFailure(self, test, err)
+        self._events.append(('addExpectedFailure', self._err(test, err)))
+
+    def addUnexpectedSuccess(self, test):
+        unittest.TestResult.addUnexpectedSuccess(self, test)
+        self._events.append(('addUnexpectedSuccess', ()))
+
+class _RemoteResultMixin(object):
+    "Lets a result class format errors which were already formatted remotely"
+    def _exc_info_to_string(self, err, test):
+        if isinstance(err[1], RemoteError):
+            return err[1].args[0]
+        return super(_RemoteResultMixin, self)._exc_info_to_string(err, test)
+
+class _ParallelTextTestResult(_RemoteResultMixin, unittest._TextTestResult):
+    pass
+
+def replay(result, test, events, elapsed):
+    "Feeds the outcome of a test run by a worker into a local result"
+    # for the run history, which would otherwise time the replay
+    test._elapsed = elapsed
+    # for test --jsonl, which sees the test but not the events
+    test._remote = dict([(name, args) for name, args in events
+        if name in ('addQueries', 'addOutput')])
+    result.startTest(test)
+    if hasattr(result, '_startTime'):
+        # so the xml result reports the time the worker measured
+        result._startTime = time.time() - elapsed
+    for name, args in events:
+        if name in ('addError', 'addFailure', 'addExpectedFailure'):
+            args = (remote_exc_info(*args),)
+        handler = getattr(result, name, None)
+        if handler is not None:
+            handler(test, *args)
+        elif name == 'addSkip':
+            result.addSuccess(test)
+    result.stopTest(test)
+
+def replay_outside(result, test, events):
+    "Feeds the errors a worker reported outside of a test into a local result"
+    for name, args in events:
+        getattr(result, name)(test, remote_exc_info(*args))
+
+def _worker(number, chunks, tasks, channel, stop_event, options, clones):
+    verbosity = options['verbosity']
+    old_names = None
+    try:
+        if not options['nodatabase']:
+            use_worker_databases(clones)
+            # backends which can't be cloned get a database of their own
+            cloned = [connection for connection, name, template in clones]
+            old_names = setup_databases(verbosity=max(verbosity - 1, 0),
+                interactive=False, suffix=number, connections=[connection
+                    for connection in get_connections()
+                    if connection not in cloned])
+        result = _RemoteTestResult(channel, stop_event, options['failfast'])
+        while not stop_event.is_set():
+            index = tasks.get()
+            if index is None:
+                break
+            channel.send(('start', index))
+            result.set_chunk(index, chunks[index])
+            startTime = time.time()
+            chunks[index](result)
+            channel.send(('done', index, time.time() - startTime))
+    finally:
+        if old_names is not None:
+            teardown_databases(old_names, verbosity=max(verbosity - 1, 0))
+        close_connections()
+        channel.close()
+
+def run_chunks(chunks, result, processes, verbosity=1, interactive=True,
+        nodatabase=False, failfast=False, order=None, recorder=None):
+    """
+    Runs the chunks in worker processes, replaying every test outcome into
+    result as it arrives. The chunks are handed out in the given order, or
+    in discovery order; idle workers take the next chunk from a shared
+    queue so no worker sits idle while others are loaded. The wall time of
+    each chunk is added to recorder.
+
+    The test databases are built once and cloned for each worker.
+    """
+    if order is None:
+        order = range(len(chunks))
+    processes = max(1, min(processes, len(chunks)))
+    options = dict(verbosity=verbosity, nodatabase=nodatabase,
+        failfast=failfast)
+
+    tasks = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    for index in order:
+        tasks.put(index)
+    for number in range(processes):
+        tasks.put(None)
+
+    numbers = range(1, processes + 1)
+    if nodatabase:
+        templates, clones = [], dict([(number, []) for number in numbers])
+    else:
+        templates, clones = setup_worker_databases(numbers, verbosity,
+            interactive)
+    close_connections()
+    # Each worker reports over its own pipe; writes to a pipe are
+    # synchronous, so nothing is lost if a worker dies mid chunk.
+    channels = {}
+    for number in numbers:
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=_worker,
+            args=(number, chunks, tasks, writer, stop_event, options,
+                clones[number]))
+        worker.daemon = True
+        worker.start()
+        writer.close()
+        channels[reader] = (number, worker)
+
+    try:
+        current = {}
+        while channels:
+            ready = select.select(channels.keys(), [], [])[0]
+            for reader in ready:
+                number, worker = channels[reader]
+                try:
+                    message = reader.recv()
+                except EOFError:
+                    del channels[reader]
+                    worker.join()
+                    if worker.exitcode:
+                        _report_crash(result, chunks, number,
+                            current.get(number), worker.exitcode)
+                    continue
+                if message[0] == 'start':
+                    current[number] = message[1]
+                elif message[0] == 'done':
+                    if recorder is not None:
+                        recorder.add(chunk_key(chunks[message[1]]), message[2])
+                else:
+                    _replay_message(result, chunks, message)
+    finally:
+        teardown_worker_databases(templates, clones, verbosity)
+    return result
+
+def _replay_message(result, chunks, message):
+    kind, index, position, test_id, description, events, elapsed = message
+    if position is not None:
+        test = chunks[index]._tests[position]
+    else:
+        test = _RemoteTest(test_id, description)
+    if kind == 'outside':
+        replay_outside(result, test, events)
+    else:
+        replay(result, test, events, elapsed)
+
+def _report_crash(result, chunks, number, index, exitcode):
+    if index is None:
+        description = 'worker %d' % number
+    else:
+        description = 'worker %d running %s' % (number,
+            chunks[index]._tests[0].__class__.__name__)
+    test = _RemoteTest(description, description)
+    replay(result, test, [('addError', ('WorkerCrashed',
+        'Worker process %d exited with code %s\n' % (number, exitcode)))], 0.0)
+
+def print_summary(stream, result, time_taken):
+    "Prints the same summary unittest.TextTestRunner does"
+    result.printErrors()
+    stream.writeln(result.separator2)
+    run = result.testsRun
+    stream.writeln("Ran %d test%s in %.3fs" %
+                   (run, run != 1 and "s" or "", time_taken))
+    stream.writeln()
+    if not result.wasSuccessful():
+        stream.write("FAILED (")
+        failed, errored = map(len, (result.failures, result.errors))
+        if failed:
+            stream.write("failures=%d" % failed)
+        if errored:
+            if failed: stream.write(", ")
+            stream.write("errors=%d" % errored)
+        stream.writeln(")")
+    else:
+        stream.writeln("OK")
+
+def run_tests(test_labels, verbosity=1, interactive=True, extra_tests=[],
+        parallel=None, xml=False, nodatabase=False, failfast=False,
+        shard=None, shard_durations=None):
+    """
+    Run the unit tests for all the test labels in the provided list using
+    a pool of worker processes. Each worker creates its own test database
+    unless nodatabase is set, so the tests must not rely on data left
+    behind by another TestCase class.
+
+    Test classes are handed out longest first using the durations recorded
+    by previous runs. If shard is given as (K, N) only the Kth of N shards
+    of the suite is run. The shards are evenly loaded using the durations
+    file shard_durations, which every shard must share; without one the
+    classes are split by a hash of their names, as the history of each
+    machine differs.
+
+    Returns the number of tests that failed.
+    """
+    setup_test_environment()
+
+    settings.DEBUG = False
+    suite = build_test_suite(test_labels, extra_tests, nodatabase)
+    chunks = partition_suite(suite)
+    processes = parallel or default_worker_count()
+
+    if multiprocessing is None:
+        print >>sys.stderr, "The multiprocessing module is not available; running tests serially"
+        processes = 1
+    processes = max(1, min(processes, len(chunks)))
+
+    durations = load_durations()
+    if shard is not None:
+        if shard_durations:
+            shared = load_durations(shard_durations)
+            shards = assign_shards(estimate_durations(chunks, shared),
+                shard[1])
+        else:
+            shards = hash_shards(chunks, shard[1])
+        chunks = [chunks[index] for index in shards[shard[0] - 1]]
+    estimates = estimate_durations(chunks, durations)
+    predictable = has_history(chunks, durations)
+    live.expect(sum([chunk.countTestCases() for chunk in chunks]))
+    order = longest_first(estimates)
+    predicted = predict_makespan(estimates, order, processes)
+    recorder = DurationRecorder()
+
+    if xml:
+        from xmloutput import XMLTestRunner, _XmlTextTestResult
+        class _ParallelXmlTestResult(_RemoteResultMixin, _XmlTextTestResult):
+            pass
+        runner = XMLTestRunner(verbosity=verbosity)
+        runner._openOutputFile('parallel')
+        result = _ParallelXmlTestResult(runner.reports,
+            runner.descriptions, runner.verbosity)
+        result.outputs = (runner.stdout, runner.stderr)
+    else:
+        runner = unittest.TextTestRunner(verbosity=verbosity)
+        result = _ParallelTextTestResult(runner.stream, runner.descriptions,
+            runner.verbosity)
+
+    if verbosity >= 1:
+        print >>sys.stderr, "Running %d test classes in %d processes" % (
+            len(chunks), processes)
+
+    startTime = time.time()
+    if chunks and processes > 1:
+        run_chunks(chunks, result, processes, verbosity, interactive,
+            nodatabase, failfast, order, recorder)
+    elif chunks:
+        old_names = None
+        if not nodatabase:
+            old_names = setup_databases(verbosity, interactive)
+        result.failfast = failfast
+        try:
+            for index in order:
+                if result.shouldStop:
+                    break
+                chunkStart = time.time()
+                chunks[index](result)
+                recorder.add(chunk_key(chunks[index]),
+                    time.time() - chunkStart)
+        finally:
+            if old_names is not None:
+                teardown_databases(old_names, verbosity)
+    timeTaken = time.time() - startTime
+
+    if xml:
+        runner._writeReport(result, timeTaken)
+    else:
+        print_summary(runner.stream, result, timeTaken)
+
+    recorder.save()
+    if verbosity >= 1 and chunks:
+        if predictable:
+            print >>sys.stderr, "Predicted makespan %.3fs, actual %.3fs" % (
+                predicted, timeTaken)
+        else:
+            print >>sys.stderr, "No duration history to predict the makespan from, actual %.3fs" % (
+                timeTaken)
+
+    teardown_test_environment()
+
+    return len(result.failures) + len(result.errors)
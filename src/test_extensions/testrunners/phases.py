@@ -0,0 +1,197 @@
+"""
+Wall time and peak memory of each phase of a test command run, for
+test --profile-startup.
+
+Phases nest: time spent in a phase started inside another, such as
+fixture loading during test execution, only counts towards the inner one.
+Most phases are found by hooking the functions every runner goes through,
+build_suite, create_test_db, loaddata and so on, so runners which hand
+over to Django's own run_tests are covered too. The functions below do
+nothing unless enable() has been called.
+"""
+
+import os
+import sys
+import time
+import unittest
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_FILE = os.path.join('temp', 'profile_startup.json')
+
+_timer = None
+_installed = False
+
+def peak_rss():
+    "Returns the peak resident set size of the process so far, in kilobytes"
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak = peak / 1024 # bytes rather than kilobytes
+    return peak
+
+class PhaseTimer(object):
+    def __init__(self):
+        self.order = []
+        self.seconds = {}
+        self.calls = {}
+        self.peaks = {}
+        self.stack = []
+        self.resumed = None
+
+    def _charge(self, now):
+        "Charges the time since the current phase last resumed to it"
+        if self.stack:
+            name = self.stack[-1]
+            self.seconds[name] += now - self.resumed
+            self.peaks[name] = max(self.peaks[name], peak_rss())
+
+    def start(self, name, when=None):
+        now = time.time()
+        self._charge(now)
+        if name not in self.seconds:
+            self.order.append(name)
+            self.seconds[name] = 0.0
+            self.calls[name] = 0
+            self.peaks[name] = None
+        self.calls[name] += 1
+        self.stack.append(name)
+        self.resumed = when or now
+
+    def stop(self):
+        now = time.time()
+        self._charge(now)
+        self.stack.pop()
+        self.resumed = now
+
+    def phases(self):
+        return [{'name': name, 'seconds': self.seconds[name],
+            'calls': self.calls[name], 'peak_rss_kb': self.peaks[name]}
+            for name in self.order]
+
+def start(name, when=None):
+    "Starts a phase, pausing the current one. when backdates the start."
+    if _timer is not None:
+        _timer.start(name, when)
+
+def stop():
+    "Ends the current phase, resuming the one it was started in"
+    if _timer is not None:
+        _timer.stop()
+
+def timed(name, function):
+    "Wraps function so each call is timed as the given phase"
+    def wrapper(*args, **kwargs):
+        start(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stop()
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+def _install():
+    "Hooks the functions which mark out the phases inside a runner"
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    import django.test.simple
+    import django.test.testcases
+    from test_extensions.testrunners.database import get_connections
+
+    # runners which do "from django.test.simple import *" get these as long
+    # as they're imported afterwards
+    django.test.simple.build_suite = timed('discovery',
+        django.test.simple.build_suite)
+    django.test.simple.build_test = timed('discovery',
+        django.test.simple.build_test)
+
+    for connection in get_connections():
+        creation = connection.creation
+        creation.create_test_db = timed('test DB creation',
+            creation.create_test_db)
+        creation.destroy_test_db = timed('DB teardown',
+            creation.destroy_test_db)
+
+    call_command = django.test.testcases.call_command
+    def fixture_call_command(name, *args, **kwargs):
+        if name != 'loaddata':
+            return call_command(name, *args, **kwargs)
+        start('fixture loading')
+        try:
+            return call_command(name, *args, **kwargs)
+        finally:
+            stop()
+    django.test.testcases.call_command = fixture_call_command
+
+    # every runner ends up running a stdlib TestSuite, so the outermost one
+    # is the test execution
+    suite_run = unittest.TestSuite.run
+    depth = [0]
+    def run(suite, *args, **kwargs):
+        depth[0] += 1
+        if depth[0] == 1:
+            start('test execution')
+        try:
+            return suite_run(suite, *args, **kwargs)
+        finally:
+            if depth[0] == 1:
+                stop()
+            depth[0] -= 1
+    unittest.TestSuite.run = run
+
+def enable(started=None):
+    """
+    Starts timing phases. The hooks are installed before the runner modules
+    are imported, and left in place for later runs in the same process.
+    """
+    global _timer
+    _timer = PhaseTimer()
+    if started is not None:
+        _timer.start('command import', started)
+        _timer.stop()
+    _install()
+
+def report(path=PROFILE_FILE):
+    "Prints a table of the phases and writes them to a JSON file"
+    global _timer
+    if _timer is None:
+        return
+    timer, _timer = _timer, None
+    while timer.stack:
+        timer.stop()
+    phases = timer.phases()
+    total = sum([phase['seconds'] for phase in phases])
+
+    print >>sys.stderr
+    print >>sys.stderr, "%-20s %6s %10s %6s %14s" % ('phase', 'calls',
+        'seconds', '%', 'peak RSS (MB)')
+    for phase in phases:
+        if phase['peak_rss_kb'] is None:
+            rss = '-'
+        else:
+            rss = '%.1f' % (phase['peak_rss_kb'] / 1024.0)
+        print >>sys.stderr, "%-20s %6d %10.3f %6.1f %14s" % (phase['name'],
+            phase['calls'], phase['seconds'],
+            total and phase['seconds'] * 100 / total or 0, rss)
+    print >>sys.stderr, "%-20s %6s %10.3f" % ('total', '', total)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    output = open(path, 'w')
+    json.dump({'phases': phases, 'total_seconds': total}, output, indent=1)
+    output.close()
+    print >>sys.stderr, "Phase timings written to %s" % path
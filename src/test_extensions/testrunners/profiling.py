@@ -0,0 +1,107 @@
+"""
+Profiles each test with cProfile, for test --profile.
+
+The profiles of every test are merged into temp/profile/tests.pstats, for
+pstats or any viewer which reads it, and the functions with the most
+internal time in each TestCase class are listed in temp/profile/classes.txt.
+Each test also gets its own top five as test._hotspots, which the xml
+runner writes into its <testcase> element.
+"""
+
+import cProfile
+import os
+import pstats
+
+import listeners
+from scheduling import class_key
+
+PROFILE_DIR = os.path.join('temp', 'profile')
+
+# how many hotspots are attached to each test
+TEST_HOTSPOTS = 5
+
+def _function_name(function, root):
+    filename, line, name = function
+    if filename.startswith(root + os.sep):
+        filename = filename[len(root) + 1:]
+    if filename == '~':  # a builtin
+        return name
+    return '%s:%d(%s)' % (filename, line, name)
+
+def hotspots(stats, count, root=None):
+    """
+    Returns (function, internal time, cumulative time, calls) for the count
+    functions with the most internal time in a pstats.Stats.
+    """
+    root = os.path.abspath(root or os.getcwd())
+    # the profiler's own disable call isn't part of the test
+    functions = [item for item in stats.stats.items() if item[1][2] > 0 and
+        not item[0][2].startswith("<method 'disable' of '_lsprof")]
+    functions.sort(key=lambda item: item[1][2], reverse=True)
+    return [(_function_name(function, root), tottime, cumtime, calls)
+        for function, (primitive, calls, tottime, cumtime, callers)
+        in functions[:count]]
+
+class TestProfiler(object):
+    """
+    Listens to the tests to run a profiler from the start to the end of
+    each test, setUp and tearDown included.
+    """
+    def __init__(self, top=10):
+        self.top = top
+        self.stats = None
+        self.classes = {}
+        self.counts = {}
+        self._profile = None
+
+    def start(self):
+        listeners.add(self)
+
+    def stop(self):
+        listeners.remove(self)
+
+    def start_test(self, result, test):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop_test(self, result, test):
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return
+        profile.disable()
+        stats = pstats.Stats(profile)
+        test._hotspots = hotspots(stats, TEST_HOTSPOTS)
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(stats)
+        key = class_key(test)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if key in self.classes:
+            self.classes[key].add(stats)
+        else:
+            self.classes[key] = stats
+
+    def save(self, directory=PROFILE_DIR):
+        "Writes the merged stats and the per class report, returning the paths"
+        if self.stats is None:
+            return []
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        stats_path = os.path.join(directory, 'tests.pstats')
+        self.stats.dump_stats(stats_path)
+
+        report_path = os.path.join(directory, 'classes.txt')
+        report = open(report_path, 'w')
+        for key in sorted(self.classes.keys()):
+            stats = self.classes[key]
+            report.write('%s (%d tests, %.3fs)\n' % (key, self.counts[key],
+                stats.total_tt))
+            report.write('%10s %10s %9s  %s\n' % ('tottime', 'cumtime',
+                'calls', 'function'))
+            for function, tottime, cumtime, calls in hotspots(stats, self.top):
+                report.write('%10.4f %10.4f %9d  %s\n' % (tottime, cumtime,
+                    calls, function))
+            report.write('\n')
+        report.close()
+        return [stats_path, report_path]
@@ -0,0 +1,109 @@
+"""
+Named test runners for the test command.
+
+Runners are registered by the dotted path of their run_tests function and
+only imported when picked, so a plain run never imports coverage or
+figleaf. Other packages can add runners through the
+test_extensions.runners entry point group:
+
+    setup(...
+        entry_points = {
+            'test_extensions.runners': [
+                'mine = mypackage.runner:run_tests',
+            ],
+        },
+    )
+
+and run them with python manage.py test --runner mine.
+"""
+
+ENTRY_POINT_GROUP = 'test_extensions.runners'
+
+# Django versions prior to 1.2 don't include the DjangoTestSuiteRunner class;
+# Django versions since 1.2 include multi-database support, which doesn't play
+# nicely with the database setup in the XML test runner.
+try:
+    from django.test.simple import DjangoTestSuiteRunner
+    xml_runner = 'test_extensions.testrunners.xmloutput.XMLTestSuiteRunner'
+except ImportError:  # We are in a version prior to 1.2
+    xml_runner = 'test_extensions.testrunners.xmloutput.run_tests'
+
+RUNNERS = {
+    'nodb': 'test_extensions.testrunners.nodatabase.run_tests',
+    'nodb-coverage': 'test_extensions.testrunners.nodatabase.run_tests_with_coverage',
+    'nodb-xmlcoverage': 'test_extensions.testrunners.nodatabase.run_tests_with_xmlcoverage',
+    'coverage': 'test_extensions.testrunners.codecoverage.run_tests',
+    'xmlcoverage': 'test_extensions.testrunners.codecoverage.run_tests_xml',
+    'figleaf': 'test_extensions.testrunners.figleafcoverage.run_tests',
+    'xml': xml_runner,
+    'parallel': 'test_extensions.testrunners.parallel.run_tests',
+}
+
+# the runners taking Django's app, app.TestCase and app.TestCase.test_method
+# labels, the only ones the discovery index can check
+DJANGO_LABEL_RUNNERS = set(RUNNERS.values() + ['django.test.simple.run_tests',
+    'django.test.simple.DjangoTestSuiteRunner'])
+
+def takes_django_labels(path):
+    "Tells whether the runner at the dotted path takes Django's test labels"
+    return path in DJANGO_LABEL_RUNNERS
+
+def register_runner(name, path):
+    "Registers the runner at the dotted path under name"
+    RUNNERS[name] = path
+
+def runner_names():
+    "Returns the names of the built in and installed runners"
+    names = set(RUNNERS.keys())
+    for entry_point in _entry_points():
+        names.add(entry_point.name)
+    return sorted(names)
+
+def _entry_points(name=None):
+    try:
+        # pkg_resources is slow to import, so only when it's needed
+        import pkg_resources
+    except ImportError:
+        return []
+    return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP, name))
+
+def import_runner(path):
+    "Imports the runner at the dotted path"
+    test_path = path.split('.')
+    # Allow for Python 2.5 relative paths
+    if len(test_path) > 1:
+        test_module_name = '.'.join(test_path[:-1])
+    else:
+        test_module_name = '.'
+    test_module = __import__(test_module_name, {}, {}, test_path[-1])
+    return getattr(test_module, test_path[-1])
+
+def get_runner(name):
+    """
+    Returns the runner registered under name, or installed under it through
+    an entry point. Raises KeyError if there is no such runner.
+    """
+    if name in RUNNERS:
+        return import_runner(RUNNERS[name])
+    entry_points = _entry_points(name)
+    if not entry_points:
+        raise KeyError(name)
+    return entry_points[0].load()
+
+def select_runner(options):
+    """
+    Returns the name of the runner the test command options ask for, or
+    None for the project's TEST_RUNNER setting.
+    """
+    if options.get('runner'):
+        return options['runner']
+    if options.get('nodb'):
+        if options.get('xmlcoverage'):
+            return 'nodb-xmlcoverage'
+        elif options.get('coverage'):
+            return 'nodb-coverage'
+        return 'nodb'
+    for name in ('xmlcoverage', 'coverage', 'figleaf', 'xml'):
+        if options.get(name):
+            return name
+    return None
@@ -0,0 +1,147 @@
+"""
+Duration history and longest-first scheduling for parallel and sharded
+test runs.
+
+The wall time of each TestCase class is kept in temp/durations.json, next
+to the xml reports. Classes are handed out slowest first, which keeps one
+slow class queued at the end of the run from holding up every other
+worker.
+"""
+
+import heapq
+import os
+import time
+
+from django.utils.hashcompat import md5_constructor
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from test_extensions.jsonfile import save_json
+
+DURATIONS_FILE = os.path.join('temp', 'durations.json')
+
+def class_key(test):
+    return '%s.%s' % (test.__class__.__module__, test.__class__.__name__)
+
+def chunk_key(chunk):
+    "Returns the class key of a per class chunk built by partition_suite"
+    return class_key(chunk._tests[0])
+
+def load_durations(path=DURATIONS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        return json.load(open(path))
+    except ValueError:  # a run died while writing, start again
+        return {}
+
+def save_durations(durations, path=DURATIONS_FILE):
+    """
+    Merges the given class durations into the history file. Classes which
+    weren't run this time keep their previous durations.
+    """
+    history = load_durations(path)
+    history.update(durations)
+    save_json(history, path, indent=1, sort_keys=True)
+
+class DurationRecorder(object):
+    """
+    Accumulates the wall time of each TestCase class. The time between one
+    test stopping and the next stopping is charged to the second test, so
+    fixture loading done outside startTest is counted too.
+    """
+    def __init__(self):
+        self.durations = {}
+        self._last = time.time()
+
+    def add(self, key, seconds):
+        self.durations[key] = self.durations.get(key, 0.0) + seconds
+
+    def stop_test(self, test):
+        now = time.time()
+        self.add(class_key(test), now - self._last)
+        self._last = now
+
+    def save(self, path=DURATIONS_FILE):
+        if self.durations:
+            save_durations(self.durations, path)
+
+def estimate_durations(chunks, durations):
+    """
+    Returns the expected run time of each chunk. Classes with no history
+    are assumed to take as long as the average known class.
+    """
+    known = [durations[chunk_key(chunk)] for chunk in chunks
+        if chunk_key(chunk) in durations]
+    default = known and sum(known) / len(known) or 0.0
+    return [durations.get(chunk_key(chunk), default) for chunk in chunks]
+
+def longest_first(estimates):
+    "Returns chunk indexes ordered by descending expected run time"
+    order = range(len(estimates))
+    order.sort(key=lambda index: (-estimates[index], index))
+    return order
+
+def predict_makespan(estimates, order, processes):
+    """
+    Simulates workers taking chunks in the given order from a shared queue
+    and returns the time the last one finishes.
+    """
+    workers = [0.0] * max(1, processes)
+    for index in order:
+        heapq.heapreplace(workers, workers[0] + estimates[index])
+    return max(workers)
+
+def has_history(chunks, durations):
+    "Tells whether any of the chunks has a recorded duration"
+    for chunk in chunks:
+        if chunk_key(chunk) in durations:
+            return True
+    return False
+
+def assign_shards(estimates, shards):
+    """
+    Splits chunk indexes into the given number of shards, giving each
+    chunk, slowest first, to the shard with the least work so far. Every
+    shard must be given the same estimates, or they won't agree on the
+    split.
+    """
+    # ties are broken by chunk count so a run with no history is still
+    # spread evenly
+    loads = [(0.0, 0, shard) for shard in range(shards)]
+    assignment = [[] for shard in range(shards)]
+    for index in longest_first(estimates):
+        load, count, shard = heapq.heappop(loads)
+        assignment[shard].append(index)
+        heapq.heappush(loads, (load + estimates[index], count + 1, shard))
+    for indexes in assignment:
+        indexes.sort()
+    return assignment
+
+def hash_shards(chunks, shards):
+    """
+    Splits chunk indexes into the given number of shards by a hash of
+    their class, which every machine works out the same without sharing
+    any history, though the shards aren't evenly loaded.
+    """
+    assignment = [[] for shard in range(shards)]
+    for index, chunk in enumerate(chunks):
+        digest = md5_constructor(chunk_key(chunk)).hexdigest()
+        assignment[int(digest, 16) % shards].append(index)
+    return assignment
+
+def parse_shard(value):
+    """
+    Parses a shard given as 'K/N', meaning the Kth of N shards counting
+    from 1, and returns (K, N).
+    """
+    try:
+        shard, shards = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise ValueError("Shards must be given as K/N, not '%s'" % value)
+    if not 1 <= shard <= shards:
+        raise ValueError("Shard %d is not between 1 and %d" % (shard, shards))
+    return shard, shards
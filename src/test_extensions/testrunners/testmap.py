@@ -0,0 +1,185 @@
+"""
+Records which source files each test executes during a coverage run, and
+uses that map to pick out the tests affected by the files changed since a
+git revision.
+"""
+
+import os
+import subprocess
+import sys
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from django.db.models import get_app, get_apps
+
+from test_extensions.jsonfile import save_json
+from test_extensions.testrunners import listeners
+from test_extensions.testrunners.discovery import DiscoveryIndex
+
+TEST_MAP_FILE = os.path.join('temp', 'testmap.json')
+
+def _app_packages():
+    "Returns the package name of every installed app"
+    return [app.__name__.rsplit('.', 1)[0] for app in get_apps()]
+
+def test_label(test, packages=None):
+    """
+    Returns the label the test command accepts for a single test, that is
+    app.TestClass.test_method. Doctests can't be run one at a time, so
+    they get the label of their app. Returns None for tests which don't
+    belong to an installed app.
+    """
+    if packages is None:
+        packages = _app_packages()
+    doctest = hasattr(test, '_dt_test')
+    if doctest:
+        module = test.id()
+    else:
+        module = test.__class__.__module__
+    for package in packages:
+        if module == package or module.startswith(package + '.'):
+            app_label = package.split('.')[-1]
+            break
+    else:
+        return None
+    if doctest:
+        return app_label
+    return '%s.%s.%s' % (app_label, test.__class__.__name__,
+        test.id().split('.')[-1])
+
+class TestFileRecorder(object):
+    """
+    Records the source files each test calls into. This uses a profile
+    hook rather than a trace function so it can run alongside coverage,
+    and listens to the tests itself so it works with any test runner.
+    """
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or os.getcwd())
+        self.files = {}
+        self._current = None
+        self._packages = None
+
+    def start(self):
+        listeners.add(self)
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+        listeners.remove(self)
+
+    def _profile(self, frame, event, arg):
+        if event == 'call' and self._current is not None:
+            self._current.add(frame.f_code.co_filename)
+
+    def start_test(self, result, test):
+        self._current = set()
+
+    def stop_test(self, result, test):
+        files, self._current = self._current, None
+        if files is None:
+            return
+        if self._packages is None:
+            self._packages = _app_packages()
+        label = test_label(test, self._packages)
+        if label is not None:
+            self.files.setdefault(label, set()).update(files)
+
+    def _relative(self, filename):
+        filename = os.path.abspath(filename)
+        if filename.endswith('.pyc') or filename.endswith('.pyo'):
+            filename = filename[:-1]
+        if not filename.startswith(self.root + os.sep):
+            return None
+        return os.path.relpath(filename, self.root)
+
+    def save(self, path=TEST_MAP_FILE):
+        "Merges the recorded files into the map, keeping project files only"
+        test_map = load_test_map(path)
+        for label, files in self.files.items():
+            test_map[label] = sorted(filter(None, map(self._relative, files)))
+        save_json(test_map, path, indent=1, sort_keys=True)
+
+def load_test_map(path=TEST_MAP_FILE):
+    if not os.path.exists(path):
+        return {}
+    return json.load(open(path))
+
+def _git(*args):
+    process = subprocess.Popen(('git',) + args, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+    if process.returncode:
+        raise ValueError(errors.strip() or 'git %s failed' % ' '.join(args))
+    return [line for line in output.splitlines() if line]
+
+def changed_files(revision):
+    """
+    Returns the files changed since the given git revision, relative to
+    the current directory, including uncommitted and untracked files.
+    """
+    files = _git('diff', '--name-only', '--relative', revision) + \
+        _git('ls-files', '--others', '--exclude-standard')
+    return set([os.path.normpath(name) for name in files])
+
+def _current_labels(test_labels, index=None):
+    """
+    Returns the label of every test the given labels would run, taken from
+    the discovery index so unchanged test modules aren't imported
+    """
+    if index is None:
+        index = DiscoveryIndex()
+    if test_labels:
+        apps = [get_app(label.split('.')[0]) for label in test_labels]
+    else:
+        apps = get_apps()
+    labels = []
+    seen = set()
+    for app in apps:
+        entry = index.entry(app)
+        app_labels = list(entry['tests'])
+        if entry['doctests']:
+            app_labels.append(app.__name__.split('.')[-2])
+        for label in app_labels:
+            if label in seen:
+                continue
+            seen.add(label)
+            if not test_labels or [wanted for wanted in test_labels
+                    if label == wanted or label.startswith(wanted + '.')]:
+                labels.append(label)
+    index.save()
+    return labels
+
+def _unmapped_files(changed, test_map, path):
+    """
+    Returns the changed files no test in the map executed, such as settings,
+    templates or fixtures, leaving out the directory the map is kept in
+    """
+    mapped = set()
+    for files in test_map.values():
+        mapped.update(files)
+    directory = os.path.dirname(path)
+    return sorted([name for name in changed if name not in mapped and
+        not (directory and name.startswith(directory + os.sep))])
+
+def select_tests(revision, test_labels=(), path=TEST_MAP_FILE, index=None):
+    """
+    Returns the labels of the tests which executed a file changed since
+    revision, along with any tests which aren't in the map yet, the total
+    number of tests considered and the changed files which aren't in the
+    map. Nothing can be said about what those affect, so if there are any
+    every test is selected.
+    """
+    changed = changed_files(revision)
+    test_map = load_test_map(path)
+    labels = _current_labels(list(test_labels), index)
+    unmapped = _unmapped_files(changed, test_map, path)
+    selected = [label for label in labels if unmapped or
+        label not in test_map or changed.intersection(test_map[label])]
+    # an app label from a doctest already runs every test in the app
+    whole_apps = [label for label in selected if '.' not in label]
+    selected = [label for label in selected if '.' not in label or
+        label.split('.')[0] not in whole_apps]
+    return selected, len(labels), unmapped
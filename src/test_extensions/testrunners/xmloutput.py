@@ -1,10 +1,15 @@
-import time, traceback, string
+import sys, time, string
 from unittest import TestResult
 
 from xmlunit.unittest import _WritelnDecorator, XmlTextTestRunner as his_XmlTextTestRunner
+from scheduling import DurationRecorder
+from database import setup_databases, teardown_databases
+from junit import JUnitReports, test_properties, testcase_xml
+from capture import OutputCapture, OUTPUT_LIMIT
+from test_extensions.queries import capture_queries
 
+from django.conf import settings
 from django.test.simple import *
-from xml.sax.saxutils import escape
 
 
 try:
@@ -13,6 +18,12 @@ try:
         def run_suite(self, suite, **kwargs):
             return XMLTestRunner(verbosity=self.verbosity).run(suite)
 
+        def setup_databases(self, **kwargs):
+            return setup_databases(self.verbosity, self.interactive)
+
+        def teardown_databases(self, old_config, **kwargs):
+            teardown_databases(old_config, self.verbosity)
+
 except NameError:  # DjangoTestSuiteRunner is not available in Django < 1.2
     pass
 
@@ -36,11 +47,9 @@ def run_tests(test_labels, verbosity=1, interactive=True, extra_tests=[]):
     for test in extra_tests:
         suite.addTest(test)
 
-    old_name = settings.DATABASE_NAME
-    from django.db import connection
-    connection.creation.create_test_db(verbosity, autoclobber=not interactive)
+    old_names = setup_databases(verbosity, interactive)
     result = XMLTestRunner(verbosity=verbosity).run(suite)
-    connection.creation.destroy_test_db(old_name, verbosity)
+    teardown_databases(old_names, verbosity)
 
     teardown_test_environment()
 
@@ -48,8 +57,76 @@ def run_tests(test_labels, verbosity=1, interactive=True, extra_tests=[]):
 
 
 class XMLTestRunner(his_XmlTextTestRunner):
+    """
+    Streams each testcase to the report as it finishes, rather than
+    holding the whole report in memory until the end of the run, along
+    with what it wrote to stdout and stderr.
+    """
+    reports = None
+
+    def __init__(self, stream=sys.stderr, descriptions=1, verbosity=1):
+        self.descriptions = descriptions
+        self.verbosity = verbosity
+        limit = getattr(settings, 'TEST_OUTPUT_LIMIT', OUTPUT_LIMIT)
+        self.stdout = OutputCapture(sys.stdout, limit)
+        sys.stdout = self.stdout
+        self.stderr = OutputCapture(sys.stderr, limit)
+        sys.stderr = self.stderr
+        self.totalTime = 0.0
+        self.output = None
+
+    def _openOutputFile(self, fileName):
+        # every suite goes into the run's reports
+        if self.reports is None:
+            self.reports = JUnitReports(_app_label)
+
     def _makeResult(self):
-        return _XmlTextTestResult(self.testResults, self.descriptions, self.verbosity)
+        result = _XmlTextTestResult(self.reports, self.descriptions, self.verbosity)
+        result.outputs = (self.stdout, self.stderr)
+        return result
+
+    def run(self, test):
+        "Run the given test case or test suite."
+        self._openOutputFile('test_output')
+        result = self._makeResult()
+        startTime = time.time()
+        test(result)
+        self._writeReport(result, time.time() - startTime)
+        result.durations.save()
+        return result
+
+    def _writeReport(self, result, timeTaken):
+        paths = self.reports.close(self.stdout.read(), self.stderr.read(),
+            result.params)
+        self.reports = None
+        # put the real streams back
+        for capture, name in ((self.stdout, 'stdout'), (self.stderr, 'stderr')):
+            if getattr(sys, name) is capture:
+                setattr(sys, name, capture.stream)
+            capture.close()
+        print '======================================================================'
+        print 'Ran %d test%s in %.3fs' % (result.testsRun,
+            result.testsRun != 1 and 's' or '', timeTaken)
+        print '----------------------------------------------------------------------'
+        print 'See generated report%s:' % (len(paths) != 1 and 's' or ''), \
+            ', '.join(paths), '\n'
+        if result.wasSuccessful():
+            print 'OK'
+        else:
+            counts = []
+            if result.failures:
+                counts.append('failures=%d' % len(result.failures))
+            if result.errors:
+                counts.append('errors=%d' % len(result.errors))
+            print 'FAILED (%s)' % ', '.join(counts)
+
+def _app_label(test):
+    "Returns the app a test belongs to, from its module or doctest name"
+    parts = test.id().split('.')
+    for index, part in enumerate(parts[1:]):
+        if part in ('tests', 'models'):
+            return parts[index]
+    return parts[0]
 
 class _XmlTextTestResult(unittest.TestResult):
     """A test result class that can print xml formatted text results to a stream.
@@ -58,15 +135,26 @@ class _XmlTextTestResult(unittest.TestResult):
     """
     #separator1 = '=' * 70
     #separator2 = '-' * 70
-    def __init__(self, stream, descriptions, verbosity):
+    def __init__(self, reports, descriptions, verbosity):
         TestResult.__init__(self)
-        self.stream = _WritelnDecorator(stream)
+        self.reports = reports
+        # the report of the test running
+        self._report = None
+        # the test running, for errors reported outside of one
+        self._test = None
+        self.stream = None
         self.showAll = verbosity > 1
         self.descriptions = descriptions
         self._lastWas = 'success'
-        self._errorsAndFailures = ""
+        self._failures = []
         self._startTime = 0.0
         self.params=""
+        self.durations = DurationRecorder()
+        self._queries = None
+        self._remoteQueries = None
+        # the OutputCaptures of stdout and stderr, set by the runner
+        self.outputs = None
+        self._remoteOutput = None
 
     def getDescription(self, test):
         if self.descriptions:
@@ -76,48 +164,66 @@ class _XmlTextTestResult(unittest.TestResult):
 
     def startTest(self, test):  #  CONSIDER  why are there 2 startTests in here?
         self._startTime = time.time()
+        self._test = test
+        self._lastWas = 'success'
+        self._failures = []
+        self._report = self.reports.writer_for(test)
+        self.stream = _WritelnDecorator(self._report)
         test._extraXML = ''
         test._extraAssertions = []
+        self._queries = capture_queries()
+        if self.outputs:
+            for capture in self.outputs:
+                capture.start_test()
         TestResult.startTest(self, test)
-        self.stream.write('<testcase classname="%s' % test.__class__.__name__ + '" name="%s' % test.id().split('.')[-1] + '"')
-        desc = (test._testMethodDoc or '').strip()
-        # desc = test.shortDescription()  #  CONSIDER why did this fail?
-
-        if desc:
-            desc = _cleanHTML(desc)
-            desc = desc.replace('\n', '&#10;')
-            self.stream.write(' desc="%s"' % desc)
 
     def stopTest(self, test):
         stopTime = time.time()
         deltaTime = stopTime - self._startTime
+        queries = self._queries.stop()
+        query_count, query_time = len(queries), queries.time()
+        if self._remoteQueries is not None:
+            # the test ran in a parallel worker
+            query_count, query_time = self._remoteQueries
+            self._remoteQueries = None
+        stdout = stderr = ''
+        if self.outputs:
+            stdout, stderr = [capture.stop_test() for capture in self.outputs]
+        if self._remoteOutput is not None:
+            stdout, stderr = self._remoteOutput
+            self._remoteOutput = None
         TestResult.stopTest(self, test)
-        self.stream.write(' time="%.3f"' % deltaTime)
-        self.stream.write('>')
-        if self._lastWas != 'success':
-            if self._lastWas == 'error':
-                self.stream.write(self._errorsAndFailures)
-            elif self._lastWas == 'failure':
-                self.stream.write(self._errorsAndFailures)
-            else:
-                assert(False)
+        self._test = None
+        self.durations.stop_test(test)
 
         seen = {}
-
+        assertions = []
         for assertion in test._extraAssertions:
             if not seen.has_key(assertion):
-                self._addAssertion(assertion[:110]) # :110 avoids tl;dr TODO use a lexical truncator
+                assertions.append(assertion[:110]) # :110 avoids tl;dr TODO use a lexical truncator
                 seen[assertion] = True
 
-        self.stream.write('</testcase>')
-        self._errorsAndFailures = ""
+        desc = (test._testMethodDoc or '').strip()
+        # desc = test.shortDescription()  #  CONSIDER why did this fail?
+        properties = [('queries', '%d' % query_count),
+            ('query_time', '%.3f' % query_time)] + test_properties(test)
+        self.stream.write(testcase_xml(test.__class__.__name__,
+            test.id().split('.')[-1], deltaTime, desc, self._failures,
+            assertions, properties, stdout, stderr, self._report.fingerprints))
+        self._failures = []
 
         if test._extraXML != '':
             self.stream.write(test._extraXML)
+        self._report.add(self._lastWas, deltaTime)
+        self._report.flush()
+
+    def addQueries(self, test, count, seconds):
+        "Takes the query count and time of a test run elsewhere"
+        self._remoteQueries = (count, seconds)
 
-    def _addAssertion(self, diagnostic):
-        diagnostic = _cleanHTML(diagnostic)
-        self.stream.write('<assert>' + diagnostic + '</assert>')
+    def addOutput(self, test, stdout, stderr):
+        "Takes what a test run elsewhere wrote to stdout and stderr"
+        self._remoteOutput = (stdout, stderr)
 
     def addSuccess(self, test):
         TestResult.addSuccess(self, test)
@@ -128,30 +234,32 @@ class _XmlTextTestResult(unittest.TestResult):
         if err[0] is KeyboardInterrupt:
             self.shouldStop = 1
         self._lastWas = 'error'
-        self._errorsAndFailures += '<error type="%s">' % err[0].__name__
-        for line in apply(traceback.format_exception, err):
-           for l in line.split("\n")[:-1]:
-              self._errorsAndFailures += escape(l)
-        self._errorsAndFailures += "</error>"
+        # formatted once, by TestResult
+        self._add_problem(test, ('error', err[0].__name__, self.errors[-1][1]))
 
     def addFailure(self, test, err):
         TestResult.addFailure(self, test, err)
         if err[0] is KeyboardInterrupt:
             self.shouldStop = 1
         self._lastWas = 'failure'
-        self._errorsAndFailures += '<failure type="%s">' % err[0].__name__
-        for line in apply(traceback.format_exception, err):
-           for l in line.split("\n")[:-1]:
-              self._errorsAndFailures += escape(l)
-        self._errorsAndFailures += "</failure>"
+        self._add_problem(test, ('failure', err[0].__name__,
+            self.failures[-1][1]))
+
+    def _add_problem(self, test, failure):
+        if test is self._test:
+            self._failures.append(failure)
+            return
+        # TransactionTestCase reports fixture loading and teardown errors
+        # outside of startTest and stopTest; they get a testcase of their own
+        report = self.reports.writer_for(test)
+        report.write(testcase_xml(test.__class__.__name__,
+            test.id().split('.')[-1], 0.0, failures=[failure],
+            seen=report.fingerprints))
+        report.add(failure[0], 0.0)
+        report.flush()
 
     def printErrors(self):
         pass #assert False
 
     def printErrorList(self, flavour, errors):
         assert False
-
-def _cleanHTML(whut):
-    return whut.replace('"', '&quot;'). \
-                replace('<', '&lt;').  \
-                replace('>', '&gt;')
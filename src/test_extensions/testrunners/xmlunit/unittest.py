@@ -750,6 +750,9 @@ class XmlTextTestRunner:
             self._std.write(string)
             return
 
+        def flush(self):
+            self._std.flush()
+
         def read(self):
             return self._string
             
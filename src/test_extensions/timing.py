@@ -0,0 +1,36 @@
+"""
+Times a callable over several rounds and summarises the timings, for
+BenchmarkCommon and the scripts in benchmarks/. Doesn't need Django.
+"""
+
+import math
+from timeit import default_timer
+
+def measure(callable, rounds=10, warmup=2):
+    "Calls callable warmup times untimed, then returns the seconds each of rounds calls took"
+    for i in range(warmup):
+        callable()
+    timings = []
+    for i in range(rounds):
+        start = default_timer()
+        callable()
+        timings.append(default_timer() - start)
+    return timings
+
+def percentile(timings, percent):
+    "Returns the nearest rank percentile of the timings"
+    timings = sorted(timings)
+    rank = int(math.ceil(percent / 100.0 * len(timings)))
+    return timings[max(rank, 1) - 1]
+
+def summarize(timings):
+    "Returns the rounds, min, median, p95, mean and max of the timings, in seconds"
+    timings = sorted(timings)
+    middle = len(timings) // 2
+    if len(timings) % 2:
+        median = timings[middle]
+    else:
+        median = (timings[middle - 1] + timings[middle]) / 2.0
+    return {'rounds': len(timings), 'min': timings[0], 'median': median,
+        'p95': percentile(timings, 95), 'mean': sum(timings) / len(timings),
+        'max': timings[-1]}
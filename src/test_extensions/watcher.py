@@ -0,0 +1,176 @@
+"""
+Watches the source files of a project's loaded modules for changes. Uses
+inotify through pyinotify where it's available, and falls back to polling
+the modification time of each file.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Seconds to keep collecting changes after a save, so saving several files
+# at once only reports one change
+DEBOUNCE = 0.2
+
+_win = (sys.platform == "win32")
+
+def _source_file(filename):
+    filename = os.path.abspath(filename)
+    if filename.endswith(".pyc") or filename.endswith(".pyo"):
+        filename = filename[:-1]
+    return filename
+
+def project_modules(root=None):
+    """
+    Returns a dict mapping the source file of every loaded module under
+    root, the current directory by default, to the module's name.
+    """
+    root = os.path.abspath(root or os.getcwd())
+    modules = {}
+    for name, module in sys.modules.items():
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            continue
+        filename = _source_file(filename)
+        if filename.startswith(root + os.sep):
+            modules[filename] = name
+    return modules
+
+class BaseWatcher(object):
+    debounce = DEBOUNCE
+
+    def __init__(self, root=None, extra_files=None):
+        self.root = root
+        self.extra_files = extra_files is not None and extra_files or []
+
+    def files(self):
+        return project_modules(self.root).keys() + \
+            [_source_file(filename) for filename in self.extra_files]
+
+    def changes(self, timeout=None):
+        """
+        Returns the files changed since the last call, waiting up to
+        timeout seconds, or for ever if it's None, for one to change.
+        """
+        raise NotImplementedError
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds for files to change, then returns them
+        once no more changes have come in for the debounce period.
+        """
+        changed = self.changes(timeout)
+        while changed:
+            more = [filename for filename in self.changes(self.debounce)
+                if filename not in changed]
+            if not more:
+                break
+            changed.extend(more)
+        return changed
+
+class StatWatcher(BaseWatcher):
+    """
+    Polls the modification time of every project module, plus any extra
+    files such as ones which failed to import.
+    """
+    interval = 1
+
+    def __init__(self, root=None, extra_files=None):
+        super(StatWatcher, self).__init__(root, extra_files)
+        self.mtimes = {}
+        self.poll()
+
+    def poll(self):
+        "Returns the files changed since the last poll"
+        changed = []
+        for filename in self.files():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue # File might be in an egg, so it can't be reloaded.
+            mtime = stat.st_mtime
+            if _win:
+                mtime -= stat.st_ctime
+            previous = self.mtimes.get(filename)
+            self.mtimes[filename] = mtime
+            if previous is not None and previous != mtime:
+                changed.append(filename)
+        return changed
+
+    def changes(self, timeout=None):
+        waited = 0
+        while timeout is None or waited < timeout:
+            step = self.interval
+            if timeout is not None:
+                step = min(step, timeout - waited)
+            time.sleep(step)
+            waited += step
+            changed = self.poll()
+            if changed:
+                return changed
+        return []
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Watches the directories holding project modules with inotify, so no
+    time is spent checking files until one of them is written.
+    """
+    def __init__(self, root=None, extra_files=None):
+        super(InotifyWatcher, self).__init__(root, extra_files)
+        # editors either write the file in place or move a new one over it
+        self.mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+            pyinotify.IN_DELETE
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.manager, self._event)
+        self.directories = set()
+        self.watched = set()
+        self.pending = []
+        self._watch()
+
+    def _watch(self):
+        "Watches the directories of any modules imported since the last call"
+        self.watched = set(self.files())
+        directories = set([os.path.dirname(filename)
+            for filename in self.watched])
+        for directory in directories - self.directories:
+            if os.path.isdir(directory):
+                self.manager.add_watch(directory, self.mask)
+                self.directories.add(directory)
+
+    def _event(self, event):
+        # the pathname isn't mapped to the source file, so writing
+        # bytecode doesn't count as a change
+        filename = os.path.abspath(event.pathname)
+        if filename in self.watched and filename not in self.pending:
+            self.pending.append(filename)
+
+    def changes(self, timeout=None):
+        self._watch()
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while not self.pending:
+            if timeout is None:
+                milliseconds = None
+            else:
+                milliseconds = int((deadline - time.time()) * 1000)
+                if milliseconds <= 0:
+                    break
+            if self.notifier.check_events(milliseconds):
+                self.notifier.read_events()
+                self.notifier.process_events()
+        changed, self.pending = self.pending, []
+        return changed
+
+def get_watcher(root=None, extra_files=None):
+    "Returns an inotify watcher where possible, and a polling one otherwise"
+    if pyinotify is not None:
+        try:
+            return InotifyWatcher(root, extra_files)
+        except (OSError, pyinotify.PyinotifyError):
+            pass # not on Linux, or out of inotify instances
+    return StatWatcher(root, extra_files)
@@ -0,0 +1,109 @@
+"""
+Tests of the test database helpers. Run them from the root of the checkout
+with Django installed:
+
+    python tests/test_database.py
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'src'))
+from django.conf import settings
+if not settings.configured:
+    settings.configure(DATABASE_ENGINE='sqlite3', DATABASE_NAME=':memory:',
+        INSTALLED_APPS=[])
+
+from test_extensions.testrunners import database
+
+class _Creation(object):
+    def __init__(self):
+        self.created = False
+
+    def create_test_db(self, verbosity=1, autoclobber=False):
+        self.created = True
+
+    def _rollback_works(self):
+        return True
+
+class _Connection(object):
+    "A Django 1.1 connection, which connects to settings.DATABASE_NAME"
+    def __init__(self):
+        self.settings_dict = {'DATABASE_NAME': settings.DATABASE_NAME}
+        self.connection = None
+        self.creation = _Creation()
+
+    def cursor(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.settings_dict['DATABASE_NAME'])
+        return self.connection.cursor()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+SETTINGS = ('DATABASE_ENGINE', 'DATABASE_NAME', 'TEST_DATABASE_NAME',
+    'DATABASE_SUPPORTS_TRANSACTIONS')
+PATCHED = ('_multi_db', 'schema_fingerprint', 'call_command')
+
+class KeepdbReuseTest(unittest.TestCase):
+    "Reusing a kept test database with the settings of Django 1.1"
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.settings = [(name, getattr(settings, name, None))
+            for name in SETTINGS]
+        self.patched = [(name, getattr(database, name)) for name in PATCHED]
+        settings.DATABASE_ENGINE = 'sqlite3'
+        settings.DATABASE_NAME = 'dev.db'
+        settings.TEST_DATABASE_NAME = 'test_kept.db'
+        settings.DATABASE_SUPPORTS_TRANSACTIONS = False
+        self.commands = []
+        database._multi_db = lambda: False
+        database.schema_fingerprint = lambda connection: 'fingerprint'
+        database.call_command = lambda name, **options: \
+            self.commands.append((name, options))
+        sqlite3.connect('test_kept.db').close()
+        database.save_fingerprints({'test_kept.db': 'fingerprint'})
+        self.connection = _Connection()
+
+    def tearDown(self):
+        self.connection.close()
+        for name, value in self.patched:
+            setattr(database, name, value)
+        for name, value in self.settings:
+            setattr(settings, name, value)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def reuse(self):
+        return database._keepdb_create_test_db(self.connection,
+            self.connection.creation.create_test_db, verbosity=0)
+
+    def test_reuses_the_kept_database(self):
+        self.assertEqual('test_kept.db', self.reuse())
+        self.failIf(self.connection.creation.created)
+        self.assertEqual('test_kept.db', settings.DATABASE_NAME)
+        self.assertEqual('test_kept.db',
+            self.connection.settings_dict['DATABASE_NAME'])
+
+    def test_records_transaction_support(self):
+        self.reuse()
+        self.assertEqual(True, settings.DATABASE_SUPPORTS_TRANSACTIONS)
+
+    def test_flushes_the_kept_database(self):
+        self.reuse()
+        self.assertEqual([('flush', {'verbosity': 0, 'interactive': False})],
+            self.commands)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests of picking the tests affected by a change from the test map. Run
+them from the root of the checkout with Django installed:
+
+    python tests/test_testmap.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'src'))
+from django.conf import settings
+if not settings.configured:
+    settings.configure(DATABASE_ENGINE='sqlite3', DATABASE_NAME=':memory:',
+        INSTALLED_APPS=[])
+
+try:
+    import json
+except ImportError:  # We are in a version prior to Python 2.6
+    from django.utils import simplejson as json
+
+from test_extensions.testrunners import testmap
+
+LABELS = ['shop.OrderTest.test_total', 'shop.OrderTest.test_tax',
+    'blog.PostTest.test_slug']
+TEST_MAP = {
+    'shop.OrderTest.test_total': ['shop/models.py', 'shop/tests.py'],
+    'shop.OrderTest.test_tax': ['shop/tax.py', 'shop/tests.py'],
+    'blog.PostTest.test_slug': ['blog/models.py', 'blog/tests.py'],
+}
+
+class SelectTestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'testmap.json')
+        output = open(self.path, 'w')
+        json.dump(TEST_MAP, output)
+        output.close()
+        self.patched = [(name, getattr(testmap, name))
+            for name in ('changed_files', '_current_labels')]
+        self.changed = set()
+        testmap.changed_files = lambda revision: self.changed
+        testmap._current_labels = lambda test_labels, index=None: list(LABELS)
+
+    def tearDown(self):
+        for name, value in self.patched:
+            setattr(testmap, name, value)
+        shutil.rmtree(self.directory)
+
+    def select(self, *changed):
+        self.changed = set(changed)
+        return testmap.select_tests('master', path=self.path)
+
+    def test_selects_the_tests_which_ran_a_changed_file(self):
+        self.assertEqual((['shop.OrderTest.test_tax'], 3, []),
+            self.select('shop/tax.py'))
+
+    def test_selects_nothing_without_changes(self):
+        self.assertEqual(([], 3, []), self.select())
+
+    def test_runs_everything_for_a_file_no_test_ran(self):
+        self.assertEqual((LABELS, 3, ['shop/fixtures/orders.json']),
+            self.select('shop/tax.py', 'shop/fixtures/orders.json'))
+
+    def test_ignores_the_directory_of_the_map(self):
+        self.assertEqual(([], 3, []),
+            self.select(os.path.join(self.directory, 'durations.json')))
+
+if __name__ == '__main__':
+    unittest.main()